@@ -1,3 +1,5 @@
+import time
+
 from dotenv import load_dotenv
 from dataclasses import dataclass, field
 from typing import Annotated, List, Literal, Optional
@@ -13,15 +15,24 @@ from dataclasses import dataclass
 from langchain_openai import ChatOpenAI
 
 from typing import Annotated, Optional, List
-from .config import OPENAI_API_KEY
-from .rag import retrieve_lore
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
+
+from .config import LATENCY_SLO_S, OPENAI_API_KEY, OPENAI_BASE_URL, USER_TOKEN_BUDGET
+from .ingestion import EntityType, GameKey
+from .prefetch import PrefetchedLore
+from .rag import citation_index, retrieve_lore
+from .routing import MODEL_TIERS, ModelRouter
 
 SYSTEM_PROMPT = """You are RODIN, a lore assistant for the BioShock universe.
 
-You have access to a tool called get_bioshock_lore(query) that returns canon-ish wiki excerpts.
+You have access to a tool called get_bioshock_lore(query, game, entity_type, section) that returns canon-ish wiki excerpts.
 
 Rules:
 - For lore questions, call get_bioshock_lore and ground your answer in retrieved excerpts.
+- Pass game/entity_type/section filters only when the question clearly targets one
+  (e.g. game="bioshock_infinite" for Columbia questions). If a filtered search comes back
+  empty or thin, retry without filters.
 - Do NOT invent major facts. If the excerpts do not support a claim, either omit it or mark confidence low.
 - Populate the structured response fields:
   - summary: your final answer
@@ -35,6 +46,7 @@ Rules:
 model = init_chat_model(
     "gpt-4.1-mini",           # model name
     model_provider="openai",  # important: use OpenAI provider
+    base_url=OPENAI_BASE_URL,
     temperature=0.5,
     timeout=10,
     max_tokens=1000,
@@ -42,13 +54,23 @@ model = init_chat_model(
 
 checkpointer = InMemorySaver()
 
-basic_model = ChatOpenAI(model="gpt-4o-mini")
-advanced_model = ChatOpenAI(model="gpt-4o")
+router = ModelRouter(latency_slo_s=LATENCY_SLO_S, user_token_budget=USER_TOKEN_BUDGET)
+
+# One client per routable model; the timeout turns a hung call into a fallback
+routed_models = {
+    tier.name: ChatOpenAI(
+        model=tier.name,
+        base_url=OPENAI_BASE_URL,
+        timeout=LATENCY_SLO_S * 3,
+        max_retries=0,
+    )
+    for tier in MODEL_TIERS
+}
 
 @dataclass
 class SourceRef:
     title: Annotated[str, "Wiki page title the chunk came from."]
-    chunk_index: Annotated[int, "Chunk index within that page (0-based)."]
+    chunk_index: Annotated[int, "The excerpt's CHUNK value: block index within that page (0-based)."]
     snippet: Annotated[str, "Short excerpt from the retrieved chunk (for UI/debugging)."]
 
 @dataclass
@@ -83,50 +105,209 @@ class bioshock_lore_response:
         "Optional notes about ambiguity, missing info, or why confidence is not high."
     ] = None
 
+@dataclass
+class LoreContext:
+    """Per-invocation runtime context passed as `agent.invoke(..., context=...)`."""
+    user_id: str = ""
+    prefetch: Optional[PrefetchedLore] = None
+    inject_prefetch: bool = False
+
+
+# Total excerpt characters per tool result (the old 6 x 600-char cap),
+# shared across the retrieved parent blocks rather than granted to each
+CONTEXT_CHAR_BUDGET = 3600
+
+
+def excerpt_limits(lengths: List[int], budget: int = CONTEXT_CHAR_BUDGET) -> List[int]:
+    """
+    Split the character budget across excerpts: short ones are kept whole and
+    what they leave over goes to the longer ones, which are trimmed evenly.
+    """
+    limits = [0] * len(lengths)
+    remaining = budget
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+    for n, i in enumerate(order):
+        limits[i] = min(lengths[i], remaining // (len(order) - n))
+        remaining -= limits[i]
+    return limits
+
+
+def excerpt_window(doc: Document, limit: int) -> str:
+    """
+    Up to `limit` chars of the doc's text, centred on the child chunk that
+    matched the query (match_start/match_end) when the text is too long.
+    """
+    raw = doc.page_content
+    text = raw.strip().replace("\n", " ")
+    if len(text) <= limit:
+        return text
+
+    lead = len(raw) - len(raw.lstrip())
+    match_start = max(0, int(doc.metadata.get("match_start", 0)) - lead)
+    match_end = max(match_start, int(doc.metadata.get("match_end", match_start)) - lead)
+    # Centre on the match; a match longer than the window keeps its start
+    centre = (match_start + match_end) // 2
+    start = min(max(0, centre - limit // 2), match_start, len(text) - limit)
+    start = max(0, start)
+    end = start + limit
+    return ("..." if start > 0 else "") + text[start:end] + ("..." if end < len(text) else "")
+
+
+def format_lore_docs(docs: List[Document]) -> str:
+    """Render retrieved chunks as the compact payload the agent cites from."""
+    limits = excerpt_limits([len(d.page_content.strip()) for d in docs])
+
+    lines: list[str] = []
+    for d, limit in zip(docs, limits):
+        title = d.metadata.get("page_title", "<no title>")
+        chunk_index = citation_index(d)
+        excerpt = excerpt_window(d, limit)
+
+        section_name = d.metadata.get("section", "")
+
+        header = f"TITLE={title} | CHUNK={chunk_index} | SECTION={section_name}"
+        # Near-duplicate chunks were merged at ingest; list the other pages too
+        if d.metadata.get("duplicate_count"):
+            header += f" | ALSO_ON={d.metadata.get('source_titles', '')}"
+
+        lines.append(f"[{header}] {excerpt}")
+
+    return "\n\n".join(lines)
+
+
 @tool
-def get_bioshock_lore(query: str) -> str:
+def get_bioshock_lore(
+    query: str,
+    runtime: ToolRuntime[LoreContext],
+    game: Optional[GameKey] = None,
+    entity_type: Optional[EntityType] = None,
+    section: Optional[str] = None,
+) -> str:
     """
     Retrieve relevant BioShock wiki chunks for a query.
 
+    Optional filters narrow the search to one partition of the wiki:
+      game: "bioshock", "bioshock_2" or "bioshock_infinite" (DLC folds into its game)
+      entity_type: "character", "location", "enemy", "weapon", "ability", "item", "audio_log", "other"
+      section: exact wiki section heading, e.g. "Biography" or "Audio Diaries"
+
     Returns a compact textual payload that includes titles/chunk indices + excerpts.
     The agent must cite which chunks it used in the structured response.
     """
-    docs = retrieve_lore(query, k=6, backend="chroma")
+    k = 6
+    docs: Optional[List[Document]] = None
 
-    lines: list[str] = []
-    for d in docs:
-        title = d.metadata.get("page_title", "<no title>")
-        chunk_index = int(d.metadata.get("chunk_index", -1))
-        text = d.page_content.strip().replace("\n", " ")
+    # Reuse the speculative search on the user message if this is the same question
+    prefetch = runtime.context.prefetch if runtime.context else None
+    unfiltered = not (game or entity_type or section)
+    if prefetch is not None and unfiltered and prefetch.matches(query, k=k):
+        docs = prefetch.result()
+        if docs is not None:
+            docs = docs[:k]
 
-        # Keep excerpts short to reduce prompt bloat
-        excerpt = text[:600] + ("..." if len(text) > 600 else "")
+    if docs is None:
+        docs = retrieve_lore(
+            query,
+            k=k,
+            backend="chroma",
+            game=game,
+            entity_type=entity_type,
+            section=section,
+        )
 
-        lines.append(f"[TITLE={title} | CHUNK={chunk_index}] {excerpt}")
+    if not docs:
+        return "No matching excerpts. Try again with fewer or no filters."
+
+    return format_lore_docs(docs)
+
+@wrap_model_call
+def inject_prefetched_lore(request: ModelRequest, handler) -> ModelResponse:
+    """
+    In "inject" mode, hand the prefetched excerpts to the first model call of a
+    turn so it can answer without a get_bioshock_lore round trip.
+    Goes into the system prompt, not the message history, so it isn't checkpointed.
+    """
+    ctx = request.runtime.context
+    if (
+        ctx is None
+        or not ctx.inject_prefetch
+        or ctx.prefetch is None
+        or not request.messages
+        or not isinstance(request.messages[-1], HumanMessage)
+    ):
+        return handler(request)
+
+    docs = ctx.prefetch.result()
+    if not docs:
+        return handler(request)
+
+    prompt = (
+        f"{request.system_prompt or ''}\n\n"
+        "PREFETCHED EXCERPTS for the latest user message (same format as get_bioshock_lore).\n"
+        "If they answer the question, respond directly and cite them; otherwise call the tool.\n\n"
+        f"{format_lore_docs(docs)}"
+    )
+    return handler(request.override(system_prompt=prompt))
+
+def _latest_question(messages) -> str:
+    for m in reversed(messages):
+        if isinstance(m, HumanMessage):
+            return m.content if isinstance(m.content, str) else str(m.content)
+    return ""
+
+
+def _tokens_used(response: ModelResponse, request: ModelRequest) -> float:
+    """Prefer the provider's usage report; fall back to a chars/4 estimate."""
+    total = 0
+    for m in response.result:
+        usage = getattr(m, "usage_metadata", None)
+        if usage:
+            total += usage.get("total_tokens", 0)
+    if total:
+        return float(total)
+    chars = sum(len(str(m.content)) for m in request.messages) + len(request.system_prompt or "")
+    return chars / 4.0
 
-    return "\n\n".join(lines)
 
 @wrap_model_call
 def dynamic_model_selection(request: ModelRequest, handler) -> ModelResponse:
-    """Choose model based on conversation complexity."""
-    # TODO: add way to keep seperate count per user and reset count after X amount of time has passed
-    message_count = len(request.state["messages"])
+    """
+    Route each model call through the ModelRouter: cheapest model that fits the
+    question's complexity, the user's recent usage and the latency SLO.
+    Falls back down the route's list when a model errors out.
+    """
+    ctx = request.runtime.context
+    user_id = ctx.user_id if ctx is not None and ctx.user_id else "anonymous"
+
+    decision = router.route(
+        user_id=user_id,
+        question=_latest_question(request.messages),
+        thread_messages=len(request.state["messages"]),
+    )
+
+    last_error: Optional[Exception] = None
+    for name in [decision.model, *decision.fallbacks]:
+        started = time.monotonic()
+        try:
+            response = handler(request.override(model=routed_models[name]))
+        except Exception as e:
+            router.record_result(name, time.monotonic() - started, ok=False)
+            last_error = e
+            continue
 
-    if message_count > 10:
-        # Use an advanced model for longer conversations
-        model = advanced_model
-    else:
-        # Otherwise stick to basic, cheaper model
-        model = basic_model
+        router.record_result(name, time.monotonic() - started, ok=True)
+        router.record_usage(user_id, _tokens_used(response, request))
+        return response
 
-    request.model = model
-    return handler(request)
+    assert last_error is not None
+    raise last_error
 
 def build_agent():
     model = init_chat_model(
         "gpt-4.1-mini",
         model_provider="openai",
         api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
         temperature=0.3,
     )
 
@@ -138,7 +319,8 @@ def build_agent():
         system_prompt=SYSTEM_PROMPT,
         response_format=ToolStrategy(bioshock_lore_response),
         checkpointer=checkpointer,
-        middleware=[dynamic_model_selection]
+        context_schema=LoreContext,
+        middleware=[inject_prefetched_lore, dynamic_model_selection]
     )
     return agent
 
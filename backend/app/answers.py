@@ -0,0 +1,415 @@
+# backend/app/answers.py
+from __future__ import annotations
+
+import hashlib
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from .agent import LoreContext, build_agent
+from .config import SPECULATIVE_RETRIEVAL
+from .docstore import ANSWER_DB_NAME, AnswerStore
+from .ingestion import derive_partition, is_redirect, iter_raw_pages
+from .prefetch import start_prefetch
+from .rag import VectorBackend, get_vectorstore_dir, get_version_dir, lease_index
+from .verifier import verify_and_polish_summary
+
+# How many of the most-linked article titles get a precomputed answer
+DEFAULT_TOP_N = 300
+
+# Present (holding top_n) once precompute has been run for a backend; publish
+# hooks only refresh answers for new index versions while it exists.
+PRECOMPUTE_FLAG = "PRECOMPUTE"
+
+_LINK_RE = re.compile(r"\[\[([^\]|#]+)")
+_REDIRECT_TARGET_RE = re.compile(r"#REDIRECT\s*\[\[([^\]|#]+)", re.IGNORECASE)
+_DISAMBIGUATION_RE = re.compile(r"\s*\([^)]*\)\s*$")
+
+# "What is X?", "Who are the X?", "Tell me about X" -> X
+_QUESTION_PATTERNS = (
+    re.compile(r"^(?:what|who)\s+(?:is|are|was|were)\s+(.+)$"),
+    re.compile(r"^tell\s+me\s+about\s+(.+)$"),
+)
+
+
+# --- Answer pipeline (shared with /ask) ---
+
+
+def answer_question(
+    agent,
+    message: str,
+    user_id: str,
+    thread_id: str,
+) -> dict:
+    """
+    Run the agent + verifier pass for one question.
+    Returns the structured response as a plain dict (summary already polished).
+    """
+    # Start retrieval on the raw question now so it overlaps the first model call
+    prefetch = start_prefetch(message) if SPECULATIVE_RETRIEVAL != "off" else None
+
+    result = agent.invoke(
+        {"messages": [{"role": "user", "content": message}]},
+        config={"configurable": {"thread_id": thread_id}},
+        context=LoreContext(
+            user_id=user_id,
+            prefetch=prefetch,
+            inject_prefetch=SPECULATIVE_RETRIEVAL == "inject",
+        ),
+    )
+
+    response = asdict(result["structured_response"])
+
+    # --- Verifier pass (polish summary only) ---
+    evidence = "\n".join(
+        f"[{s['title']} | chunk {s['chunk_index']}] {s['snippet']}"
+        for s in response["sources"]
+    )
+
+    # 2nd pass that checks work from original agent; replace only the summary
+    response["summary"] = verify_and_polish_summary(
+        summary=response["summary"],
+        evidence=evidence,
+    )
+    return response
+
+
+# --- Alias handling ---
+
+
+def normalize_title(link: str) -> str:
+    """MediaWiki title form: spaces for underscores, first letter upper-case."""
+    title = " ".join(link.replace("_", " ").split())
+    return title[:1].upper() + title[1:]
+
+
+def normalize_alias(text: str) -> str:
+    """Lower-case, punctuation-free, article-free key used for alias lookups."""
+    text = text.lower().replace("_", " ")
+    text = re.sub(r"[^\w\s']", " ", text)
+    text = " ".join(text.split())
+    return re.sub(r"^(?:the|a|an)\s+", "", text)
+
+
+def question_alias(message: str) -> Optional[str]:
+    """
+    Reduce a message to the entity alias it asks about, for template
+    questions ("What is X?") or a bare entity name. None if it's empty.
+    """
+    text = " ".join(message.lower().split()).rstrip("?.! ")
+    for pattern in _QUESTION_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            text = match.group(1)
+            break
+    return normalize_alias(text) or None
+
+
+# --- Corpus scan ---
+
+
+@dataclass
+class CorpusEntity:
+    title: str
+    page_hash: str
+    entity_type: str
+    inbound_links: int = 0
+
+
+def scan_corpus() -> tuple[Dict[str, CorpusEntity], Dict[str, str]]:
+    """
+    One pass over the dump: article entities with content hashes and inbound
+    link counts, plus an alias map (normalized alias -> canonical title)
+    built from titles and redirects.
+    """
+    entities: Dict[str, CorpusEntity] = {}
+    redirects: Dict[str, str] = {}
+    link_counts: Counter = Counter()
+
+    for page in iter_raw_pages():
+        if page.kind != "article":
+            continue
+
+        if is_redirect(page.text):
+            match = _REDIRECT_TARGET_RE.search(page.text)
+            if match:
+                redirects[page.title] = normalize_title(match.group(1))
+            continue
+
+        entities[page.title] = CorpusEntity(
+            title=page.title,
+            page_hash=hashlib.sha256(page.text.encode("utf-8")).hexdigest(),
+            entity_type=derive_partition(page.text).entity_type,
+        )
+        for link in _LINK_RE.findall(page.text):
+            if ":" not in link:  # skip Category:/File: and other namespaces
+                link_counts[normalize_title(link)] += 1
+
+    for target, count in link_counts.items():
+        target = redirects.get(target, target)
+        if target in entities:
+            entities[target].inbound_links += count
+
+    aliases: Dict[str, str] = {}
+    for title in entities:
+        aliases.setdefault(normalize_alias(_DISAMBIGUATION_RE.sub("", title)), title)
+    for source, target in redirects.items():
+        if target in entities:
+            aliases.setdefault(normalize_alias(source), target)
+    # Exact titles win over disambiguation-stripped or redirect aliases
+    for title in entities:
+        aliases[normalize_alias(title)] = title
+
+    return entities, aliases
+
+
+def template_question(entity: CorpusEntity) -> str:
+    name = _DISAMBIGUATION_RE.sub("", entity.title)
+    if entity.entity_type == "character":
+        return f"Who is {name}?"
+    return f"What is {name}?"
+
+
+# --- Batch precompute ---
+
+
+def enable_precompute(backend: VectorBackend = "chroma", top_n: int = DEFAULT_TOP_N) -> None:
+    (get_vectorstore_dir(backend) / PRECOMPUTE_FLAG).write_text(str(top_n), encoding="utf-8")
+
+
+def disable_precompute(backend: VectorBackend = "chroma") -> None:
+    (get_vectorstore_dir(backend) / PRECOMPUTE_FLAG).unlink(missing_ok=True)
+
+
+def precompute_top_n(backend: VectorBackend = "chroma") -> Optional[int]:
+    """The enabled top_n, or None if precompute is off for this backend."""
+    flag = get_vectorstore_dir(backend) / PRECOMPUTE_FLAG
+    if not flag.exists():
+        return None
+    text = flag.read_text(encoding="utf-8").strip()
+    return int(text) if text.isdigit() else DEFAULT_TOP_N
+
+
+def precompute_answers(
+    backend: VectorBackend = "chroma",
+    top_n: int = DEFAULT_TOP_N,
+    previous_version: Optional[str] = None,
+    concurrency: int = 4,
+    force: bool = False,
+    version: Optional[str] = None,
+    cancel: Optional[threading.Event] = None,
+) -> dict:
+    """
+    Generate verified answers for the top_n most-linked titles into the live
+    index version's answer store.
+
+    Entries whose page hash is unchanged are kept (or copied from
+    `previous_version`'s store); new or changed pages are regenerated.
+    If `version` is given and is no longer live, nothing is done. Setting
+    `cancel` stops generating further answers (the finished ones are kept).
+    """
+    entities, aliases = scan_corpus()
+    top = sorted(entities.values(), key=lambda e: (-e.inbound_links, e.title))[:top_n]
+    top_titles = {e.title for e in top}
+
+    # Hold a lease so this version can't be garbage-collected mid-run
+    with lease_index(backend) as index:
+        if version is not None and index.version != version:
+            print(f"Skipping answer precompute for {version}: {index.version} is live now.")
+            return {"superseded": 1}
+
+        store = AnswerStore(index.path / ANSWER_DB_NAME)
+        store.replace_aliases({a: t for a, t in aliases.items() if t in top_titles})
+        existing = store.page_hashes()
+
+        previous: Optional[AnswerStore] = None
+        if previous_version and previous_version != index.version:
+            prev_path = get_version_dir(backend, previous_version) / ANSWER_DB_NAME
+            if prev_path.exists():
+                previous = AnswerStore(prev_path)
+
+        stats = Counter()
+        todo: list[CorpusEntity] = []
+        for entity in top:
+            if not force and existing.get(entity.title) == entity.page_hash:
+                stats["unchanged"] += 1
+                continue
+            old = previous.get(entity.title) if previous and not force else None
+            if old is not None and old["page_hash"] == entity.page_hash:
+                store.put(entity.title, old["question"], old["response"], old["page_hash"], old["generated_at"])
+                stats["copied"] += 1
+                continue
+            todo.append(entity)
+
+        print(
+            f"Precomputed answers for {index.version}: {stats['unchanged']} unchanged, "
+            f"{stats['copied']} copied, {len(todo)} to generate."
+        )
+        if not todo:
+            return dict(stats)
+
+        agent = build_agent()
+        stats_lock = threading.Lock()
+
+        def generate(entity: CorpusEntity) -> None:
+            if cancel is not None and cancel.is_set():
+                with stats_lock:
+                    stats["cancelled"] += 1
+                return
+            question = template_question(entity)
+            try:
+                # Fresh thread per question so no conversation history leaks in
+                response = answer_question(
+                    agent,
+                    question,
+                    user_id="precompute",
+                    thread_id=f"precompute-{uuid.uuid4().hex}",
+                )
+            except Exception as e:
+                with stats_lock:
+                    stats["failed"] += 1
+                print(f"  failed: {entity.title}: {e}")
+                return
+            store.put(entity.title, question, response, entity.page_hash, time.time())
+            with stats_lock:
+                stats["generated"] += 1
+
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="rodin-precompute") as pool:
+            list(pool.map(generate, todo))
+
+    print(f"Precompute finished: {dict(stats)}")
+    return dict(stats)
+
+
+_precompute_state_lock = threading.Lock()
+_precompute_running: Dict[str, threading.Event] = {}  # backend -> cancel event of the active run
+_precompute_pending: Dict[str, tuple[str, Optional[str]]] = {}  # backend -> newest queued run
+
+
+def start_background_precompute(
+    backend: VectorBackend,
+    version: str,
+    previous_version: Optional[str],
+) -> bool:
+    """
+    Index publish hook: refresh the answer store for the newly live `version`
+    in a daemon thread, if precompute is enabled (see enable_precompute).
+
+    If a refresh is already running it is cancelled, and this version is
+    queued to run as soon as it stops (only the newest queued version is kept).
+    Returns False if precompute is disabled.
+    """
+    top_n = precompute_top_n(backend)
+    if top_n is None:
+        return False
+
+    with _precompute_state_lock:
+        running = _precompute_running.get(backend)
+        if running is not None:
+            _precompute_pending[backend] = (version, previous_version)
+            running.set()
+            return True
+        cancel = _precompute_running[backend] = threading.Event()
+
+    def run() -> None:
+        nonlocal cancel
+        target, previous = version, previous_version
+        while True:
+            try:
+                stats = precompute_answers(
+                    backend=backend,
+                    top_n=top_n,
+                    previous_version=previous,
+                    version=target,
+                    cancel=cancel,
+                )
+                if "superseded" not in stats:
+                    previous = target
+            except Exception as e:
+                print(f"Background answer precompute failed: {e}")
+
+            with _precompute_state_lock:
+                queued = _precompute_pending.pop(backend, None)
+                if queued is None:
+                    del _precompute_running[backend]
+                    return
+                cancel = _precompute_running[backend] = threading.Event()
+            # Copy from the last store a run filled (even partly, if cancelled);
+            # the queued version's own predecessor may have been skipped
+            target = queued[0]
+
+    threading.Thread(target=run, daemon=True, name=f"precompute-{backend}").start()
+    return True
+
+
+# --- Serving ---
+
+_store_cache: Dict[str, AnswerStore] = {}
+
+
+def record_precomputed_exchange(agent, thread_id: str, message: str, response: dict) -> None:
+    """
+    Write a question answered from the store into the thread's checkpoint,
+    so a follow-up in the same thread sees it like any agent answer.
+    """
+    agent.update_state(
+        {"configurable": {"thread_id": thread_id}},
+        {"messages": [HumanMessage(content=message), AIMessage(content=response["summary"])]},
+    )
+
+
+def lookup_precomputed(message: str, backend: VectorBackend = "chroma") -> Optional[dict]:
+    """
+    Return a stored response if the message is a template question (or bare
+    name) for a precomputed entity in the live index version, else None.
+    """
+    alias = question_alias(message)
+    if alias is None:
+        return None
+
+    with lease_index(backend) as index:
+        path = index.path / ANSWER_DB_NAME
+        if not path.exists():
+            return None
+        store = _store_cache.get(str(path))
+        if store is None:
+            store = _store_cache[str(path)] = AnswerStore(path)
+
+        title = store.resolve(alias)
+        if title is None:
+            return None
+        entry = store.get(title)
+    return entry["response"] if entry else None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompute answers for the most-linked BioShock pages")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP_N, help="Number of most-linked titles")
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions generated in parallel")
+    parser.add_argument("--previous-version", help="Copy unchanged answers from this index version")
+    parser.add_argument("--force", action="store_true", help="Regenerate every answer")
+    parser.add_argument("--disable", action="store_true", help="Stop refreshing answers on index rebuilds")
+    args = parser.parse_args()
+
+    if args.disable:
+        disable_precompute()
+        print("Answer precompute disabled; the live version's answers are served until the next rebuild.")
+        raise SystemExit(0)
+
+    # Opt in: later index rebuilds refresh the answers for their version
+    enable_precompute(top_n=args.top)
+    precompute_answers(
+        top_n=args.top,
+        previous_version=args.previous_version,
+        concurrency=args.concurrency,
+        force=args.force,
+    )
@@ -1,19 +1,29 @@
 from __future__ import annotations
 
-from fastapi import FastAPI
+import secrets
+
+from fastapi import Depends, FastAPI, Header, HTTPException
 from pydantic import BaseModel, Field
 from typing import Literal, Optional
 
 from .agent import build_agent  # do NOT import tools here
-from .agent import bioshock_lore_response as BioShockLoreResponse  # your dataclass
-
-from .verifier import verify_and_polish_summary
+from .answers import (
+    answer_question,
+    lookup_precomputed,
+    record_precomputed_exchange,
+    start_background_precompute,
+)
+from .config import ADMIN_TOKEN
+from .rag import index_status, on_index_published, start_background_rebuild
 
 
 app = FastAPI(title="RODIN BioShock Lore Agent")
 
 agent = build_agent()
 
+# Regenerate precomputed answers whenever a new index version goes live
+on_index_published(start_background_precompute)
+
 
 class AskRequest(BaseModel):
     user_id: str = Field(..., description="Stable user identifier (Discord user id, etc.)")
@@ -39,52 +49,57 @@ class BioShockLoreResponseModel(BaseModel):
 class AskResponse(BaseModel):
     answer: str
     structured: BioShockLoreResponseModel
+    precomputed: bool = False
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (set RODIN_ADMIN_TOKEN)")
+    if not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
-@app.post("/ask", response_model=AskResponse)
-def ask(req: AskRequest):
-    thread_id = req.thread_id or req.user_id
+@app.get("/admin/index", dependencies=[Depends(require_admin)])
+def admin_index():
+    """Live index version, leases, versions on disk and rebuild state."""
+    return index_status("chroma")
 
-    result = agent.invoke(
-        {"messages": [{"role": "user", "content": req.message}]},
-        config={"configurable": {"thread_id": thread_id}},
-    )
 
-    structured: BioShockLoreResponse = result["structured_response"]
+@app.post("/admin/reindex", status_code=202, dependencies=[Depends(require_admin)])
+def admin_reindex():
+    """Rebuild the index in the background; it is swapped live when complete."""
+    if not start_background_rebuild("chroma"):
+        raise HTTPException(status_code=409, detail="An index rebuild is already running")
+    return index_status("chroma")
 
-    structured_model = BioShockLoreResponseModel(
-        summary=structured.summary,
-        key_entities=list(structured.key_entities or []),
-        timeline_events=list(structured.timeline_events or []),
-        sources=[
-            SourceRefModel(title=s.title, chunk_index=s.chunk_index, snippet=s.snippet)
-            for s in (structured.sources or [])
-        ],
-        confidence=structured.confidence,
-        notes=structured.notes,
-    )
 
-    # --- Verifier pass (polish summary only) ---
-    evidence = "\n".join(
-        f"[{s.title} | chunk {s.chunk_index}] {s.snippet}"
-        for s in structured_model.sources
-    )
+@app.post("/ask", response_model=AskResponse)
+def ask(req: AskRequest):
+    thread_id = req.thread_id or req.user_id
 
-    # 2nd pass that checks work from original agent
-    corrected_summary = verify_and_polish_summary(
-        summary=structured_model.summary,
-        evidence=evidence,
+    # Template questions about high-traffic entities are served from the store.
+    # They name their entity, so thread history can't change the answer; the
+    # exchange is still recorded so follow-ups in the thread can refer to it.
+    cached = lookup_precomputed(req.message)
+    if cached is not None:
+        record_precomputed_exchange(agent, thread_id, req.message, cached)
+        structured_model = BioShockLoreResponseModel(**cached)
+        return AskResponse(
+            answer=structured_model.summary,
+            structured=structured_model,
+            precomputed=True,
+        )
+
+    # Agent + verifier pass (summary polished against the cited snippets)
+    structured_model = BioShockLoreResponseModel(
+        **answer_question(agent, req.message, user_id=req.user_id, thread_id=thread_id)
     )
 
-    # Replace only summary/answer; keep all other structured fields intact
-    structured_model.summary = corrected_summary
-
     return AskResponse(
         answer=structured_model.summary,
         structured=structured_model,
     )
-
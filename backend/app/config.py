@@ -16,9 +16,37 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 if not OPENAI_API_KEY:
     raise RuntimeError("OPENAI_API_KEY is not set in .env")
 
+# Optional: point every OpenAI client at a compatible server (e.g. the
+# load-test stub in scripts/loadtest.py). Unset = api.openai.com.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
 DATA_DIR = BASE_DIR / "backend" / "data"
 RAW_DIR = DATA_DIR / "raw"
 PROCESSED_DIR = DATA_DIR / "processed"
 
 # Root folder for *all* vectorstores (chroma, faiss, pinecone, etc.)
-VECTORSTORE_ROOT = BASE_DIR / "backend" / "vectorstore"
+# RODIN_VECTORSTORE_ROOT overrides it, e.g. for a scratch index built against a stub.
+VECTORSTORE_ROOT = Path(os.getenv("RODIN_VECTORSTORE_ROOT") or BASE_DIR / "backend" / "vectorstore")
+
+# Speculative retrieval for /ask:
+#   "off"    - the agent searches only when it calls get_bioshock_lore
+#   "reuse"  - search the raw user message while the first model call runs;
+#              the tool reuses that result when its query is close enough
+#   "inject" - wait for that search and put the excerpts into the first model
+#              call so it can answer without a tool round trip
+SPECULATIVE_RETRIEVAL = os.getenv("RODIN_SPECULATIVE_RETRIEVAL", "reuse").strip().lower()
+if SPECULATIVE_RETRIEVAL not in ("off", "reuse", "inject"):
+    raise RuntimeError(
+        f"RODIN_SPECULATIVE_RETRIEVAL must be off, reuse or inject (got {SPECULATIVE_RETRIEVAL!r})"
+    )
+
+# Model routing: cheapest capable model whose recent p95 latency is under the
+# SLO; users over the (decaying) token budget are kept on the basic tier.
+try:
+    LATENCY_SLO_S = float(os.getenv("RODIN_LATENCY_SLO_S", "8"))
+    USER_TOKEN_BUDGET = float(os.getenv("RODIN_USER_TOKEN_BUDGET", "50000"))
+except ValueError as e:
+    raise RuntimeError(f"Invalid model routing setting in .env: {e}") from e
+
+# Shared secret for /admin/* endpoints (sent as X-Admin-Token). Unset = disabled.
+ADMIN_TOKEN = os.getenv("RODIN_ADMIN_TOKEN", "")
@@ -0,0 +1,131 @@
+# backend/app/dedup.py
+from __future__ import annotations
+
+import hashlib
+import re
+from typing import Iterable, Iterator
+
+import numpy as np
+from langchain_core.documents import Document
+
+# --- MinHash / LSH settings ---
+
+NUM_PERM = 128
+LSH_BANDS = 16  # 16 bands x 8 rows -> candidate pairs start around Jaccard ~0.7
+SHINGLE_WORDS = 5
+SIMILARITY_THRESHOLD = 0.85
+
+# Prime just above 2**32: with 32-bit shingle hashes, a * h + b stays inside uint64.
+_PRIME = np.uint64(4294967311)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+_rng = np.random.default_rng(seed=1)
+_PERM_A = _rng.integers(1, 2**32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.integers(0, 2**32, size=NUM_PERM, dtype=np.uint64)
+
+_WORD_RE = re.compile(r"\w+")
+
+SOURCE_TITLES_SEP = " | "
+
+# Boolean partition flags (see ingestion.partition_metadata / section_flag)
+# that a merged chunk inherits from every copy
+PARTITION_FLAG_PREFIXES = ("game_", "entity_", "section_")
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> set[str]:
+    """Lowercased word n-grams; short texts fall back to a single shingle."""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    """Return a NUM_PERM-long MinHash signature for the text."""
+    hashes = np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+            for s in shingles(text)
+        ),
+        dtype=np.uint64,
+    )
+    # (n_shingles, NUM_PERM) permuted hashes, min over shingles
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) % _PRIME & _MAX_HASH
+    return permuted.min(axis=0)
+
+
+def _band_keys(signature: np.ndarray) -> list[bytes]:
+    rows = NUM_PERM // LSH_BANDS
+    return [signature[i * rows:(i + 1) * rows].tobytes() for i in range(LSH_BANDS)]
+
+
+def _merge_metadata(kept: Document, dup: Document) -> None:
+    """Fold a duplicate's provenance into the kept chunk's metadata."""
+    meta = kept.metadata
+    titles = meta["source_titles"].split(SOURCE_TITLES_SEP)
+    dup_title = dup.metadata.get("page_title", "")
+    if dup_title and dup_title not in titles:
+        titles.append(dup_title)
+        meta["source_titles"] = SOURCE_TITLES_SEP.join(titles)
+    meta["duplicate_count"] += 1
+
+    # A merged chunk belongs to every partition any of its copies belonged to.
+    # The scalar `entity_type`/`section` stay those of the kept copy (display only).
+    for key, value in dup.metadata.items():
+        if key.startswith(PARTITION_FLAG_PREFIXES) and value is True:
+            meta[key] = True
+    games = [g for g in meta.get("games", "").split(",") if g]
+    for g in dup.metadata.get("games", "").split(","):
+        if g and g not in games:
+            games.append(g)
+    if "games" in meta:
+        meta["games"] = ",".join(games)
+
+
+def deduplicate_documents(
+    docs: Iterable[Document],
+    threshold: float = SIMILARITY_THRESHOLD,
+) -> Iterator[Document]:
+    """
+    Collapse near-duplicate chunks (MinHash + LSH banding).
+
+    The first occurrence of a chunk is kept; later near-copies are dropped and
+    their page titles appended to the kept chunk's `source_titles`. Because a
+    kept chunk can still gain titles, results are only yielded once the whole
+    input has been consumed.
+    """
+    kept: list[Document] = []
+    signatures: list[np.ndarray] = []
+    buckets: dict[tuple[int, bytes], list[int]] = {}
+
+    for doc in docs:
+        sig = minhash_signature(doc.page_content)
+        keys = _band_keys(sig)
+
+        match: int | None = None
+        seen: set[int] = set()
+        for band, key in enumerate(keys):
+            for candidate in buckets.get((band, key), ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if np.mean(signatures[candidate] == sig) >= threshold:
+                    match = candidate
+                    break
+            if match is not None:
+                break
+
+        if match is not None:
+            _merge_metadata(kept[match], doc)
+            continue
+
+        doc.metadata["source_titles"] = doc.metadata.get("page_title", "")
+        doc.metadata["duplicate_count"] = 0
+
+        idx = len(kept)
+        kept.append(doc)
+        signatures.append(sig)
+        for band, key in enumerate(keys):
+            buckets.setdefault((band, key), []).append(idx)
+
+    yield from kept
@@ -0,0 +1,152 @@
+# backend/app/docstore.py
+from __future__ import annotations
+
+import json
+import sqlite3
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from langchain_core.documents import Document
+
+PARENT_DB_NAME = "parents.sqlite3"
+
+
+@contextmanager
+def connect(path: Path) -> Iterator[sqlite3.Connection]:
+    """
+    One short-lived connection: committed (or rolled back) and then closed.
+    sqlite3's own context manager only commits, leaving the file handle open.
+    """
+    conn = sqlite3.connect(path)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+class ParentStore:
+    """
+    Keyed store for parent (section-level) Documents, persisted next to the
+    vector index. Child chunks carry a `parent_id` that points in here.
+    """
+
+    def __init__(self, path: Path, flush_every: int = 500):
+        self.path = path
+        self.flush_every = flush_every
+        self._pending: list[tuple[str, str, str]] = []
+
+        with connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS parents ("
+                " parent_id TEXT PRIMARY KEY,"
+                " content TEXT NOT NULL,"
+                " metadata TEXT NOT NULL)"
+            )
+
+    def add(self, doc: Document) -> None:
+        """Buffer one parent Document; written in batches of `flush_every`."""
+        self._pending.append(
+            (doc.metadata["parent_id"], doc.page_content, json.dumps(doc.metadata))
+        )
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with connect(self.path) as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO parents (parent_id, content, metadata) VALUES (?, ?, ?)",
+                self._pending,
+            )
+        self._pending.clear()
+
+    def get_many(self, parent_ids: Iterable[str]) -> Dict[str, Document]:
+        ids: List[str] = list(dict.fromkeys(parent_ids))
+        if not ids:
+            return {}
+
+        placeholders = ",".join("?" * len(ids))
+        with connect(self.path) as conn:
+            rows = conn.execute(
+                f"SELECT parent_id, content, metadata FROM parents WHERE parent_id IN ({placeholders})",
+                ids,
+            ).fetchall()
+
+        return {
+            pid: Document(page_content=content, metadata=json.loads(meta))
+            for pid, content, meta in rows
+        }
+
+    def __len__(self) -> int:
+        with connect(self.path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM parents").fetchone()[0]
+
+
+ANSWER_DB_NAME = "answers.sqlite3"
+
+
+class AnswerStore:
+    """
+    Precomputed answers keyed by canonical page title, plus an alias table
+    (normalized alias -> title). Lives inside an index version directory, so
+    answers are tied to the index they were generated against.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        with connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS answers ("
+                " title TEXT PRIMARY KEY,"
+                " question TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " page_hash TEXT NOT NULL,"
+                " generated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS aliases ("
+                " alias TEXT PRIMARY KEY,"
+                " title TEXT NOT NULL)"
+            )
+
+    def get(self, title: str) -> Optional[dict]:
+        with connect(self.path) as conn:
+            row = conn.execute(
+                "SELECT question, response, page_hash, generated_at FROM answers WHERE title = ?",
+                (title,),
+            ).fetchone()
+        if row is None:
+            return None
+        question, response, page_hash, generated_at = row
+        return {
+            "title": title,
+            "question": question,
+            "response": json.loads(response),
+            "page_hash": page_hash,
+            "generated_at": generated_at,
+        }
+
+    def put(self, title: str, question: str, response: dict, page_hash: str, generated_at: float) -> None:
+        with connect(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO answers (title, question, response, page_hash, generated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (title, question, json.dumps(response), page_hash, generated_at),
+            )
+
+    def page_hashes(self) -> Dict[str, str]:
+        with connect(self.path) as conn:
+            return dict(conn.execute("SELECT title, page_hash FROM answers").fetchall())
+
+    def resolve(self, alias: str) -> Optional[str]:
+        with connect(self.path) as conn:
+            row = conn.execute("SELECT title FROM aliases WHERE alias = ?", (alias,)).fetchone()
+        return row[0] if row else None
+
+    def replace_aliases(self, aliases: Dict[str, str]) -> None:
+        with connect(self.path) as conn:
+            conn.execute("DELETE FROM aliases")
+            conn.executemany("INSERT INTO aliases (alias, title) VALUES (?, ?)", aliases.items())
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, Literal
+from typing import Callable, Iterable, Literal, get_args
 
 import xml.etree.ElementTree as ET
 
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from .dedup import deduplicate_documents
+
 
 # --- Paths ---
 
@@ -21,6 +24,17 @@ DUMP_PATH = BASE_DIR / "backend" / "data" / "raw" / "bioshock_pages_current.xml"
 # --- Types ---
 
 SourceKind = Literal["article", "forum"]
+GameKey = Literal["bioshock", "bioshock_2", "bioshock_infinite"]
+EntityType = Literal[
+    "audio_log",
+    "ability",
+    "weapon",
+    "enemy",
+    "character",
+    "location",
+    "item",
+    "other",
+]
 
 
 @dataclass
@@ -57,22 +71,25 @@ def classify_page(ns: int, title: str) -> SourceKind:
 # --- XML parsing into RawPage objects ---
 
 
-def iter_raw_pages() -> Iterable[RawPage]:
-    """Stream RawPage objects from the MediaWiki XML dump."""
-    if not DUMP_PATH.exists():
-        raise FileNotFoundError(f"Dump not found at: {DUMP_PATH}")
+def iter_dump_pages(dump_path: Path) -> Iterable[RawPage]:
+    """
+    Stream RawPage objects from a MediaWiki XML dump with iterparse,
+    clearing each <page> once read so memory stays flat on large dumps.
+    """
+    context = ET.iterparse(dump_path, events=("start", "end"))
+    _, root = next(context)
 
-    tree = ET.parse(DUMP_PATH)
-    root = tree.getroot()
+    for event, elem in context:
+        if event != "end" or not (elem.tag == "page" or elem.tag.endswith("}page")):
+            continue
 
-    for page in root.findall(".//{*}page"):
-        title_el = page.find("./{*}title")
-        ns_el = page.find("./{*}ns")
-        text_el = page.find(".//{*}text")
+        title_el = elem.find("./{*}title")
+        ns_el = elem.find("./{*}ns")
+        text_el = elem.find(".//{*}text")
 
         title = title_el.text if title_el is not None else "<NO TITLE>"
         ns = int(ns_el.text) if ns_el is not None and ns_el.text.isdigit() else -1
-        text = text_el.text if text_el is not None else ""
+        text = (text_el.text if text_el is not None else "") or ""
 
         kind = classify_page(ns, title)
 
@@ -83,25 +100,264 @@ def iter_raw_pages() -> Iterable[RawPage]:
             kind=kind,
         )
 
+        # Drop the parsed page (and the root's reference to it)
+        elem.clear()
+        root.clear()
+
+
+def iter_raw_pages() -> Iterable[RawPage]:
+    """Stream RawPage objects from the MediaWiki XML dump."""
+    if not DUMP_PATH.exists():
+        raise FileNotFoundError(f"Dump not found at: {DUMP_PATH}")
+
+    yield from iter_dump_pages(DUMP_PATH)
+
+
+def is_redirect(text: str) -> bool:
+    """Pure redirects like '#REDIRECT [[BioShock]]'."""
+    return text.strip().upper().startswith("#REDIRECT")
+
+
+# --- Partition metadata (game / entity type / section) ---
+
+# Alias -> partition key. DLC titles fold into their parent game.
+GAME_ALIASES: dict[str, GameKey] = {
+    "BioShock Infinite": "bioshock_infinite",
+    "Burial at Sea": "bioshock_infinite",
+    "Clash in the Clouds": "bioshock_infinite",
+    "BioShock 2": "bioshock_2",
+    "Minerva's Den": "bioshock_2",
+    "BioShock": "bioshock",
+}
+
+# Longest alias first so "BioShock 2" wins over "BioShock" at the same position
+_GAME_RE = re.compile(
+    r"\b("
+    + "|".join(re.escape(a) for a in sorted(GAME_ALIASES, key=len, reverse=True))
+    + r")\b",
+    re.IGNORECASE,
+)
+_GAME_LOOKUP = {alias.lower(): key for alias, key in GAME_ALIASES.items()}
+
+# Checked in order; the first rule whose keyword appears wins.
+ENTITY_TYPE_RULES: tuple[tuple[EntityType, tuple[str, ...]], ...] = (
+    ("audio_log", ("audio diar", "voxophone", "kinetoscope")),
+    ("ability", ("plasmid", "vigor", "tonic", "gear")),
+    ("weapon", ("weapon",)),
+    ("enemy", ("enem", "splicer", "big daddies", "big sister", "boss")),
+    ("character", ("character", "people")),
+    ("location", ("location", "level", "area", "district")),
+    ("item", ("item", "upgrade", "infusion", "consumable")),
+)
+
+LEAD_SECTION = "Introduction"
+
+_CATEGORY_RE = re.compile(r"\[\[\s*Category\s*:\s*([^\]|]+)", re.IGNORECASE)
+_INFOBOX_RE = re.compile(r"\{\{\s*([^|}\n]*infobox[^|}\n]*)", re.IGNORECASE)
+_INFOBOX_GAME_FIELD_RE = re.compile(
+    r"^\s*\|\s*(?:game|games|appearances?|appears in)\s*=\s*(.+)$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# Only level-2 headings start a new section; deeper ones stay with their parent.
+_SECTION_RE = re.compile(r"^==(?!=)\s*(.+?)\s*==\s*$", re.MULTILINE)
+_MARKUP_RE = re.compile(r"\[\[(?:[^\]|]*\|)?([^\]]*)\]\]|'{2,}")
+
+
+@dataclass
+class PagePartition:
+    games: tuple[GameKey, ...]
+    entity_type: EntityType
+
+
+def _strip_markup(text: str) -> str:
+    """Drop wiki link brackets and bold/italic quotes from a short string."""
+    return _MARKUP_RE.sub(lambda m: m.group(1) or "", text).strip()
+
+
+def extract_categories(text: str) -> list[str]:
+    return [c.strip() for c in _CATEGORY_RE.findall(text)]
+
+
+def extract_games(values: Iterable[str]) -> tuple[GameKey, ...]:
+    """Return the distinct game keys mentioned in the given strings, in order."""
+    found: list[GameKey] = []
+    for value in values:
+        for match in _GAME_RE.finditer(value):
+            key = _GAME_LOOKUP[match.group(1).lower()]
+            if key not in found:
+                found.append(key)
+    return tuple(found)
+
+
+def classify_entity(infobox_names: list[str], categories: list[str]) -> EntityType:
+    """
+    Infobox template names are the strongest signal; fall back to categories.
+    """
+    for names in (infobox_names, categories):
+        lowered = [n.lower() for n in names]
+        for entity_type, keywords in ENTITY_TYPE_RULES:
+            if any(kw in name for name in lowered for kw in keywords):
+                return entity_type
+    return "other"
+
+
+def derive_partition(text: str) -> PagePartition:
+    """Derive game and entity-type partition metadata for one wiki page."""
+    categories = extract_categories(text)
+    infobox_names = [n.strip() for n in _INFOBOX_RE.findall(text)]
+    infobox_games = _INFOBOX_GAME_FIELD_RE.findall(text)
+
+    return PagePartition(
+        games=extract_games([*categories, *infobox_games]),
+        entity_type=classify_entity(infobox_names, categories),
+    )
+
+
+def split_sections(text: str) -> list[tuple[str, str]]:
+    """
+    Split page text on level-2 '== Heading ==' lines.
+    Returns (heading, body) pairs; text before the first heading is the lead.
+    """
+    sections: list[tuple[str, str]] = []
+    heading = LEAD_SECTION
+    start = 0
+
+    for match in _SECTION_RE.finditer(text):
+        sections.append((heading, text[start:match.start()]))
+        heading = _strip_markup(match.group(1)) or LEAD_SECTION
+        start = match.end()
+    sections.append((heading, text[start:]))
+
+    return [(h, body) for h, body in sections if body.strip()]
+
+
+def partition_metadata(partition: PagePartition) -> dict[str, object]:
+    """
+    Flatten a PagePartition into scalar metadata (Chroma only stores scalars).
+    Each game gets its own boolean flag so multi-game pages match every filter.
+    """
+    metadata: dict[str, object] = {
+        f"game_{key}": key in partition.games for key in sorted(set(GAME_ALIASES.values()))
+    }
+    metadata["games"] = ",".join(partition.games)
+    metadata["entity_type"] = partition.entity_type
+    # Flags as well, so a chunk merged from several pages keeps every type (see dedup)
+    metadata.update(
+        {f"entity_{t}": t == partition.entity_type for t in get_args(EntityType)}
+    )
+    return metadata
+
+
+def section_flag(section: str) -> str:
+    """Boolean metadata key for a section heading, e.g. 'Audio Diaries' -> 'section_audio_diaries'."""
+    return "section_" + (re.sub(r"\W+", "_", section.lower()).strip("_") or "untitled")
+
 
 # --- Chunking into LangChain Documents ---
 
+# Small children are what gets embedded and matched; each one points at its
+# parent (a section, or a slice of a long section) which is what the agent reads.
+
 
 def build_text_splitter() -> RecursiveCharacterTextSplitter:
-    """Create a text splitter tuned for wiki-like lore pages."""
+    """
+    Create the child splitter: chunks for similarity search, about half a
+    parent block each. No overlap: the parent block supplies the context,
+    and overlap would only add vectors (scripts/parse_dump.py projects the
+    count against flat chunking).
+    """
+    return RecursiveCharacterTextSplitter(
+        chunk_size=800,
+        chunk_overlap=0,
+        separators=["\n\n", "\n", ". ", " "],
+    )
+
+
+def build_parent_splitter() -> RecursiveCharacterTextSplitter:
+    """Create the parent splitter: section-sized context blocks, no overlap."""
     return RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
+        chunk_size=1500,
+        chunk_overlap=0,
         separators=["\n\n", "\n", ". ", " "],
     )
 
 
-def iter_article_documents() -> Iterable[Document]:
+@dataclass
+class SectionBlock:
+    """One parent block of a page section and the child chunks cut from it."""
+    section: str
+    parent_index: int
+    text: str
+    children: list[str]
+
+
+def chunk_page_sections(
+    text: str,
+    parent_splitter: RecursiveCharacterTextSplitter | None = None,
+    child_splitter: RecursiveCharacterTextSplitter | None = None,
+) -> list[SectionBlock]:
+    """
+    Split page text into parent blocks (per section, so a block never
+    straddles two headings) and split each block into child chunks.
+    """
+    parent_splitter = parent_splitter or build_parent_splitter()
+    child_splitter = child_splitter or build_text_splitter()
+
+    blocks: list[SectionBlock] = []
+    for section, body in split_sections(text):
+        for parent_text in parent_splitter.split_text(body):
+            blocks.append(
+                SectionBlock(
+                    section=section,
+                    parent_index=len(blocks),
+                    text=parent_text,
+                    children=child_splitter.split_text(parent_text),
+                )
+            )
+    return blocks
+
+
+def chunk_page_text(
+    text: str,
+    splitter: RecursiveCharacterTextSplitter | None = None,
+) -> list[tuple[str, str]]:
+    """Flattened (section, child chunk) pairs, i.e. what gets embedded."""
+    return [
+        (block.section, child)
+        for block in chunk_page_sections(text, child_splitter=splitter)
+        for child in block.children
+    ]
+
+
+def make_parent_id(page_title: str, parent_index: int) -> str:
+    return f"{page_title}#{parent_index}"
+
+
+def iter_article_documents(
+    dedupe: bool = True,
+    parent_sink: Callable[[Document], None] | None = None,
+) -> Iterable[Document]:
     """
     Yield LangChain Documents for article pages (canon-ish),
-    chunked and with metadata.
+    chunked per section and with partition metadata.
+
+    Yielded Documents are the small child chunks; each carries a `parent_id`.
+    The parent blocks themselves are handed to `parent_sink` (if given) so the
+    caller can persist them for small-to-big expansion at query time.
+    With dedupe=True, near-identical chunks are collapsed into one Document
+    whose `source_titles` lists every page it appeared on.
     """
-    splitter = build_text_splitter()
+    docs = _iter_chunked_articles(parent_sink)
+    if dedupe:
+        docs = deduplicate_documents(docs)
+    yield from docs
+
+
+def _iter_chunked_articles(
+    parent_sink: Callable[[Document], None] | None = None,
+) -> Iterable[Document]:
+    parent_splitter = build_parent_splitter()
+    child_splitter = build_text_splitter()
 
     for page in iter_raw_pages():
         # Only keep article pages for this iterator
@@ -109,34 +365,49 @@ def iter_article_documents() -> Iterable[Document]:
             continue
 
         # Skip pure redirects like '#REDIRECT [[BioShock]]'
-        if page.text.strip().upper().startswith("#REDIRECT"):
+        if is_redirect(page.text):
             continue
 
-        # Split into chunks
-        chunks = splitter.split_text(page.text)
-
-        for idx, chunk in enumerate(chunks):
-            yield Document(
-                page_content=chunk,
-                metadata={
-                    "page_title": page.title,
-                    "ns": page.ns,
-                    "source_kind": page.kind,  # "article"
-                    "chunk_index": idx,
-                },
-            )
-
-
-def load_article_documents(limit: int | None = None) -> list[Document]:
+        partition = partition_metadata(derive_partition(page.text))
+
+        # chunk_index keeps counting across the whole page
+        idx = 0
+        for block in chunk_page_sections(page.text, parent_splitter, child_splitter):
+            base_metadata = {
+                "page_title": page.title,
+                "ns": page.ns,
+                "source_kind": page.kind,  # "article"
+                "section": block.section,
+                section_flag(block.section): True,
+                "parent_id": make_parent_id(page.title, block.parent_index),
+                "parent_index": block.parent_index,
+                **partition,
+            }
+
+            if parent_sink is not None:
+                parent_sink(Document(page_content=block.text, metadata=dict(base_metadata)))
+
+            for child in block.children:
+                yield Document(
+                    page_content=child,
+                    metadata={**base_metadata, "chunk_index": idx},
+                )
+                idx += 1
+
+
+def load_article_documents(limit: int | None = None, dedupe: bool = True) -> list[Document]:
     """
     Convenience function: load article documents into a list.
     If limit is set, only take that many Documents (for quick tests).
+    De-duplication runs on the limited slice so quick tests stay quick.
     """
     docs: list[Document] = []
-    for i, doc in enumerate(iter_article_documents()):
+    for i, doc in enumerate(iter_article_documents(dedupe=False)):
         docs.append(doc)
         if limit is not None and i + 1 >= limit:
             break
+    if dedupe:
+        docs = list(deduplicate_documents(docs))
     return docs
 
 
@@ -152,4 +423,6 @@ if __name__ == "__main__":
         print(f"Title: {d.metadata['page_title']}")
         print(f"Chunk index: {d.metadata['chunk_index']}")
         print(f"Source kind: {d.metadata['source_kind']}")
+        print(f"Section: {d.metadata['section']}")
+        print(f"Games: {d.metadata['games'] or '<none>'} | Entity: {d.metadata['entity_type']}")
         print(f"Content preview: {d.page_content[:200]!r}")
@@ -0,0 +1,73 @@
+# backend/app/prefetch.py
+from __future__ import annotations
+
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+from langchain_core.documents import Document
+
+from .rag import retrieve_lore
+
+# Retrieval is I/O bound (embedding call + Chroma lookup), so threads are enough.
+# One worker per concurrent /ask: FastAPI runs sync endpoints on anyio's
+# 40-thread pool, so a smaller pool would leave prefetches queued under load.
+PREFETCH_WORKERS = 40
+_executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="rodin-prefetch")
+
+# Minimum keyword overlap between the user message and the tool query
+# for the tool to reuse the speculative result instead of searching again.
+REUSE_SIMILARITY = 0.6
+
+# Wait at most this long for a prefetch before falling back to a fresh search
+PREFETCH_TIMEOUT_S = 10.0
+
+_WORD_RE = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are about did does do for from how in is it me of on or tell the "
+    "this to was were what when where which who whom why with".split()
+)
+
+
+def query_keywords(text: str) -> frozenset[str]:
+    return frozenset(w for w in _WORD_RE.findall(text.lower()) if w not in _STOPWORDS)
+
+
+def query_similarity(a: str, b: str) -> float:
+    """Keyword Jaccard similarity between two queries (0.0 - 1.0)."""
+    ka, kb = query_keywords(a), query_keywords(b)
+    if not ka or not kb:
+        return 1.0 if ka == kb else 0.0
+    return len(ka & kb) / len(ka | kb)
+
+
+@dataclass
+class PrefetchedLore:
+    """A retrieve_lore call started on the raw user message, ahead of the agent."""
+
+    query: str
+    k: int
+    future: Future
+
+    def matches(self, query: str, k: int) -> bool:
+        return k <= self.k and query_similarity(self.query, query) >= REUSE_SIMILARITY
+
+    def result(self, timeout: float = PREFETCH_TIMEOUT_S) -> Optional[List[Document]]:
+        """
+        Return the prefetched docs, or None if retrieval failed or is too slow.
+        A prefetch that is still queued is cancelled instead of waited on:
+        searching directly is faster than waiting for a free worker.
+        """
+        if self.future.cancel():
+            return None
+        try:
+            return self.future.result(timeout=timeout)
+        except Exception:
+            return None
+
+
+def start_prefetch(query: str, k: int = 6) -> PrefetchedLore:
+    """Kick off retrieve_lore in the background and return a handle to it."""
+    future = _executor.submit(retrieve_lore, query, k, "chroma")
+    return PrefetchedLore(query=query, k=k, future=future)
@@ -1,24 +1,36 @@
 # backend/app/rag.py
 from __future__ import annotations
 
+import os
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Literal
+from typing import Callable, Iterator, List, Literal, Optional
 
 from langchain_openai import OpenAIEmbeddings
 #from langchain_community.vectorstores import # depicated and to be removed in 1.0
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from chromadb.api.shared_system_client import SharedSystemClient
 
 
-from .config import OPENAI_API_KEY, VECTORSTORE_ROOT
-from .ingestion import iter_article_documents
+from .config import OPENAI_API_KEY, OPENAI_BASE_URL, VECTORSTORE_ROOT
+from .docstore import PARENT_DB_NAME, ParentStore
+from .ingestion import EntityType, GameKey, iter_article_documents, section_flag
 
 VectorBackend = Literal["chroma"]  # later: add "faiss", "pinecone", etc.
 
+# Child hits fetched per requested result before expanding into parents
+CHILD_OVERFETCH = 3
+
 
 def get_embeddings() -> OpenAIEmbeddings:
     """Return an OpenAI embeddings instance."""
-    return OpenAIEmbeddings(api_key=OPENAI_API_KEY)
+    return OpenAIEmbeddings(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL)
 
 
 def get_vectorstore_dir(backend: VectorBackend) -> Path:
@@ -33,27 +45,112 @@ def get_vectorstore_dir(backend: VectorBackend) -> Path:
     return vs_dir
 
 
-def build_or_load_chroma() -> Chroma:
-    """
-    Build a Chroma vectorstore from article Documents if one doesn't exist
-    in backend/vectorstore/chroma, otherwise load the existing one.
-    """
-    vs_dir = get_vectorstore_dir("chroma")
-    embeddings = get_embeddings()
+# --- Versioned index directories ---
+#
+# backend/vectorstore/chroma/
+#   CURRENT                  <- name of the live version (swapped atomically)
+#   versions/<version>/      <- Chroma files + parents.sqlite3, READY once complete
+#
+# A rebuild writes a new version next to the live one and only then flips
+# CURRENT. Queries lease the version they started on, so they finish there;
+# retired versions are deleted once nothing holds a lease on them.
+
+CURRENT_POINTER = "CURRENT"
+VERSIONS_DIR = "versions"
+READY_MARKER = "READY"
+LEGACY_VERSION = "legacy"  # pre-versioning index stored directly in chroma/
+
+# Previous versions kept on disk (for rollback) besides the live one
+KEEP_PREVIOUS_VERSIONS = 1
+
+# Unfinished version dirs younger than this may be a build in another process
+STALE_BUILD_S = 6 * 3600
+
+# How often a lease re-reads CURRENT, so a rebuild run from another process is picked up
+POINTER_CHECK_INTERVAL_S = 5.0
+
+
+@dataclass(eq=False)
+class IndexVersion:
+    backend: VectorBackend
+    version: str
+    path: Path
+    vectorstore: Chroma
+    parent_store: ParentStore
+    leases: int = 0
+
+
+_index_lock = threading.RLock()
+_live_index: dict[VectorBackend, IndexVersion] = {}
+_retired_indexes: list[IndexVersion] = []
+_pointer_checked_at: dict[VectorBackend, float] = {}
+
+# Called as hook(backend, new_version, previous_version) after every swap
+PublishHook = Callable[[VectorBackend, str, Optional[str]], None]
+_publish_hooks: list[PublishHook] = []
+
+_building_versions: set[str] = set()  # guarded by _index_lock; never garbage-collected
+_gc_lock = threading.Lock()  # one collection at a time; taken before _index_lock
+_rebuild_lock = threading.Lock()
+_rebuild_status: dict[str, Optional[str]] = {
+    "building": None,
+    "last_built": None,
+    "last_error": None,
+}
 
-    # If directory is non-empty, assume we already have a persisted index
-    if any(vs_dir.iterdir()):
-        return Chroma(
-            embedding_function=embeddings,
-            persist_directory=str(vs_dir),
-        )
 
-    # Otherwise, build from documents
-    print(f"No existing Chroma index found in {vs_dir}. Building a new one...")
-    docs_iter = iter_article_documents()
+def _versions_root(backend: VectorBackend) -> Path:
+    root = get_vectorstore_dir(backend) / VERSIONS_DIR
+    root.mkdir(parents=True, exist_ok=True)
+    return root
+
+
+def get_version_dir(backend: VectorBackend, version: str) -> Path:
+    """Directory holding one index version (and its side stores)."""
+    if version == LEGACY_VERSION:
+        return get_vectorstore_dir(backend)
+    return _versions_root(backend) / version
+
+
+def read_current_version(backend: VectorBackend = "chroma") -> Optional[str]:
+    """Name of the live version on disk, or None if no index has been built."""
+    vs_dir = get_vectorstore_dir(backend)
+    pointer = vs_dir / CURRENT_POINTER
+    if pointer.exists():
+        return pointer.read_text(encoding="utf-8").strip() or None
+    # Pre-versioning layout: Chroma files directly in chroma/
+    if (vs_dir / "chroma.sqlite3").exists():
+        return LEGACY_VERSION
+    return None
+
+
+def _write_current_version(backend: VectorBackend, version: str) -> None:
+    """Point CURRENT at `version` with an atomic rename."""
+    vs_dir = get_vectorstore_dir(backend)
+    tmp = vs_dir / f"{CURRENT_POINTER}.tmp"
+    tmp.write_text(version, encoding="utf-8")
+    os.replace(tmp, vs_dir / CURRENT_POINTER)
+
+
+def _new_version_name() -> str:
+    """Timestamp down to microseconds, so names sort in build order (GC relies on it)."""
+    now = time.time()
+    micros = int(now * 1_000_000) % 1_000_000
+    return time.strftime("%Y%m%d-%H%M%S", time.localtime(now)) + f"-{micros:06d}-{uuid.uuid4().hex[:6]}"
+
+
+def build_chroma(vs_dir: Path) -> Chroma:
+    """Build a Chroma vectorstore (plus its parent store) from article Documents in vs_dir."""
+    embeddings = get_embeddings()
+
+    print(f"Building a new Chroma index in {vs_dir}...")
+    parent_store = ParentStore(vs_dir / PARENT_DB_NAME)
+    docs_iter = iter_article_documents(parent_sink=parent_store.add)
 
     # TODO (v2): switch to a streaming build instead of materializing the whole list.
     docs_list: List[Document] = list(docs_iter)
+    parent_store.flush()
+    print(f"Stored {len(parent_store)} parent sections in {parent_store.path.name}.")
     print(f"Embedding {len(docs_list)} chunks into Chroma...")
 
     vs = Chroma.from_documents(
@@ -65,48 +162,439 @@ def build_or_load_chroma() -> Chroma:
     return vs
 
 
-# Simple router if/when you add other backends
-_vectorstore_cache: dict[VectorBackend, object] = {}
-
-
-def get_vectorstore(backend: VectorBackend = "chroma"):
-    """Lazy-load or build the vectorstore for the given backend."""
-    if backend in _vectorstore_cache:
-        return _vectorstore_cache[backend]
-
+def _open_version(backend: VectorBackend, version: str) -> IndexVersion:
+    path = get_version_dir(backend, version)
     if backend == "chroma":
-        vs = build_or_load_chroma()
+        vs = Chroma(embedding_function=get_embeddings(), persist_directory=str(path))
     # elif backend == "faiss"
-    #     vs = build_or_load_faiss()
-    # elif backend == "pinecone"
-    #     vs = build_or_load_pinecone()
+    #     vs = load_faiss(path)
     else:
         raise ValueError(f"Unsupported vector backend: {backend!r}")
+    return IndexVersion(
+        backend=backend,
+        version=version,
+        path=path,
+        vectorstore=vs,
+        parent_store=ParentStore(path / PARENT_DB_NAME),
+    )
 
-    _vectorstore_cache[backend] = vs
-    return vs
+
+def _close_version(index: IndexVersion) -> None:
+    """
+    Release a retired version's Chroma client. chromadb caches one system per
+    persist directory for the life of the process, which keeps the old index
+    in memory and (on Windows) its files open so the directory can't be deleted.
+    """
+    identifier = getattr(getattr(index.vectorstore, "_client", None), "_identifier", None)
+    system = SharedSystemClient._identifier_to_system.pop(identifier, None) if identifier else None
+    if system is not None:
+        system.stop()
+
+
+def build_index_version(backend: VectorBackend = "chroma") -> str:
+    """
+    Build a complete new index version next to the live one (does not publish it).
+    Returns the version name; a half-built directory is removed on failure.
+    """
+    version = _new_version_name()
+    path = get_version_dir(backend, version)
+    with _index_lock:
+        _building_versions.add(version)
+        path.mkdir(parents=True)
+    try:
+        if backend == "chroma":
+            build_chroma(path)
+        else:
+            raise ValueError(f"Unsupported vector backend: {backend!r}")
+        (path / READY_MARKER).write_text(time.strftime("%Y-%m-%dT%H:%M:%S"), encoding="utf-8")
+    except BaseException:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+    finally:
+        with _index_lock:
+            _building_versions.discard(version)
+    return version
+
+
+def on_index_published(hook: PublishHook) -> None:
+    """
+    Register a hook to run after a new version goes live (in-process rebuild,
+    or a CURRENT swap picked up from another process). Hooks should be quick.
+    """
+    _publish_hooks.append(hook)
+
+
+def _notify_published(backend: VectorBackend, version: str, previous: Optional[str]) -> None:
+    for hook in list(_publish_hooks):
+        try:
+            hook(backend, version, previous)
+        except Exception as e:
+            print(f"Index publish hook {getattr(hook, '__name__', hook)!r} failed: {e}")
+
+
+def publish_version(backend: VectorBackend, version: str, collect: bool = True) -> None:
+    """
+    Atomically make `version` the live index, retiring the previous one.
+    With collect=False old versions are left on disk (for processes that
+    don't serve queries and so can't see other processes' leases).
+    """
+    new_index = _open_version(backend, version)
+    previous = read_current_version(backend)
+    _write_current_version(backend, version)
+    with _index_lock:
+        old = _live_index.get(backend)
+        _live_index[backend] = new_index
+        _pointer_checked_at[backend] = time.monotonic()
+        if old is not None and old.version != version:
+            _retired_indexes.append(old)
+    print(f"Live {backend} index is now version {version}.")
+    if collect:
+        collect_garbage(backend)
+    _notify_published(backend, version, previous)
+
+
+def _load_live(backend: VectorBackend) -> IndexVersion:
+    """Caller holds _index_lock. Load (or first-time build) the live version."""
+    version = read_current_version(backend)
+    if version is None:
+        # First run: nothing to serve yet, so this request waits for the build
+        print(f"No existing {backend} index found. Building the first version...")
+        version = build_index_version(backend)
+        _write_current_version(backend, version)
+    index = _open_version(backend, version)
+    _live_index[backend] = index
+    _pointer_checked_at[backend] = time.monotonic()
+    return index
+
+
+def _pointer_check_due(backend: VectorBackend) -> bool:
+    """Caller holds _index_lock. True at most once per POINTER_CHECK_INTERVAL_S."""
+    now = time.monotonic()
+    if now - _pointer_checked_at.get(backend, 0.0) < POINTER_CHECK_INTERVAL_S:
+        return False
+    _pointer_checked_at[backend] = now
+    return True
+
+
+def _refresh_from_pointer(backend: VectorBackend) -> Optional[tuple[str, str]]:
+    """
+    Pick up a CURRENT swapped by another process. The new version is opened
+    without holding _index_lock (so queries aren't stalled) and swapped in under it.
+    Returns (new_version, previous_version) if a swap happened.
+    """
+    on_disk = read_current_version(backend)
+    with _index_lock:
+        live = _live_index[backend]
+    if not on_disk or on_disk == live.version:
+        return None
+
+    new_index = _open_version(backend, on_disk)
+    with _index_lock:
+        live = _live_index[backend]
+        if live.version == on_disk:
+            # Swapped in meanwhile; new_index shares its Chroma system, so just drop it
+            return None
+        _live_index[backend] = new_index
+        _retired_indexes.append(live)
+    return on_disk, live.version
 
 
-def retrieve_lore(query: str, k: int = 4, backend: VectorBackend = "chroma") -> List[Document]:
+@contextmanager
+def lease_index(backend: VectorBackend = "chroma") -> Iterator[IndexVersion]:
+    """
+    Hold the live index version for the duration of a query. A swap during
+    the query doesn't affect it, and the version isn't deleted until released.
+    """
+    with _index_lock:
+        if backend not in _live_index:
+            _load_live(backend)
+            check_pointer = False
+        else:
+            check_pointer = _pointer_check_due(backend)
+    swapped = _refresh_from_pointer(backend) if check_pointer else None
+    with _index_lock:
+        index = _live_index[backend]
+        index.leases += 1
+    if swapped is not None:
+        print(f"Live {backend} index is now version {swapped[0]} (swapped externally).")
+        # The rebuilding process leaves old versions alone; collect them here
+        _collect_garbage_in_background(backend)
+        _notify_published(backend, *swapped)
+    try:
+        yield index
+    finally:
+        with _index_lock:
+            index.leases -= 1
+            retired_idle = index in _retired_indexes and index.leases == 0
+        if retired_idle:
+            _collect_garbage_in_background(backend)
+
+
+def _plan_garbage(backend: VectorBackend) -> tuple[list[IndexVersion], list[Path]]:
+    """
+    Caller holds _index_lock. Detach idle retired handles and pick the version
+    directories to delete; the slow part (closing, rmtree) is left to the caller.
+    """
+    live = _live_index.get(backend)
+    live_version = live.version if live else read_current_version(backend)
+    leased = {i.version for i in _retired_indexes if i.backend == backend and i.leases > 0}
+    idle = [i for i in _retired_indexes if i.backend == backend and i.leases == 0]
+    _retired_indexes[:] = [i for i in _retired_indexes if i not in idle]
+
+    candidates = sorted(
+        (p for p in _versions_root(backend).iterdir() if p.is_dir()),
+        key=lambda p: p.name,
+        reverse=True,
+    )
+    keep = {live_version, *_building_versions, *leased}
+    kept_previous = 0
+    doomed: list[Path] = []
+    for path in candidates:
+        if path.name in keep:
+            continue
+        if not (path / READY_MARKER).exists():
+            if time.time() - path.stat().st_mtime < STALE_BUILD_S:
+                continue
+        elif kept_previous < KEEP_PREVIOUS_VERSIONS:
+            kept_previous += 1
+            continue
+        doomed.append(path)
+    return idle, doomed
+
+
+def collect_garbage(backend: VectorBackend = "chroma") -> list[str]:
+    """
+    Delete version directories that are neither live, leased, being built,
+    nor among the newest KEEP_PREVIOUS_VERSIONS ready ones. Returns deleted names.
+
+    Only the serving process should call this: leases are in-process, so it is
+    the only one that knows which versions are still in use. _index_lock is
+    only held while deciding; closing clients and deleting files happen after.
+    """
+    with _gc_lock:
+        with _index_lock:
+            idle, doomed = _plan_garbage(backend)
+
+        # Release retired handles nobody is using any more
+        for index in idle:
+            _close_version(index)
+
+        deleted: list[str] = []
+        for path in doomed:
+            shutil.rmtree(path, ignore_errors=True)
+            if path.exists():
+                # Files still open (e.g. on Windows); retried on the next collection
+                print(f"Could not fully delete {backend} index version {path.name}; will retry.")
+                continue
+            deleted.append(path.name)
+
+    if deleted:
+        print(f"Garbage-collected {backend} index versions: {', '.join(deleted)}")
+    return deleted
+
+
+def _collect_garbage_in_background(backend: VectorBackend) -> None:
+    """Run collect_garbage off the request thread, so a query never waits on rmtree."""
+
+    def run() -> None:
+        try:
+            collect_garbage(backend)
+        except Exception as e:
+            print(f"Index garbage collection failed: {e}")
+
+    threading.Thread(target=run, daemon=True, name=f"gc-{backend}").start()
+
+
+def _run_rebuild(backend: VectorBackend, collect: bool = True) -> str:
+    """Caller holds _rebuild_lock; it is released here."""
+    try:
+        _rebuild_status["building"] = backend
+        _rebuild_status["last_error"] = None
+        version = build_index_version(backend)
+        publish_version(backend, version, collect=collect)
+        _rebuild_status["last_built"] = version
+        return version
+    except Exception as e:
+        _rebuild_status["last_error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _rebuild_status["building"] = None
+        _rebuild_lock.release()
+
+
+def rebuild_index(backend: VectorBackend = "chroma", collect: bool = True) -> str:
+    """
+    Build a new index version while the current one keeps serving, then swap.
+    Pass collect=False when not running inside the serving process (see
+    collect_garbage). Raises RuntimeError if a rebuild is already running.
+    """
+    if not _rebuild_lock.acquire(blocking=False):
+        raise RuntimeError("An index rebuild is already running")
+    return _run_rebuild(backend, collect=collect)
+
+
+def start_background_rebuild(backend: VectorBackend = "chroma") -> bool:
+    """Run a rebuild in a daemon thread. Returns False if one is already running."""
+    if not _rebuild_lock.acquire(blocking=False):
+        return False
+
+    def run() -> None:
+        try:
+            _run_rebuild(backend)
+        except Exception as e:
+            print(f"Background index rebuild failed: {e}")
+
+    threading.Thread(target=run, daemon=True, name=f"rebuild-{backend}").start()
+    return True
+
+
+def index_status(backend: VectorBackend = "chroma") -> dict:
+    """Live/retired versions, leases and rebuild state (for the admin endpoint)."""
+    with _index_lock:
+        live = _live_index.get(backend)
+        return {
+            "backend": backend,
+            "live_version": live.version if live else read_current_version(backend),
+            "live_leases": live.leases if live else 0,
+            "retired": [
+                {"version": i.version, "leases": i.leases}
+                for i in _retired_indexes
+                if i.backend == backend
+            ],
+            "versions_on_disk": sorted(p.name for p in _versions_root(backend).iterdir() if p.is_dir()),
+            "rebuild": dict(_rebuild_status),
+        }
+
+
+def build_metadata_filter(
+    game: Optional[GameKey] = None,
+    entity_type: Optional[EntityType] = None,
+    section: Optional[str] = None,
+) -> Optional[dict]:
+    """
+    Build a Chroma `where` pre-filter from partition metadata.
+    Filters match the boolean flags, which de-duplicated chunks carry for
+    every copy they were merged from.
+    Returns None when no partition is requested (search the whole index).
+    """
+    clauses: list[dict] = []
+    if game:
+        clauses.append({f"game_{game}": True})
+    if entity_type:
+        clauses.append({f"entity_{entity_type}": True})
+    if section:
+        clauses.append({section_flag(section): True})
+
+    if not clauses:
+        return None
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+
+def retrieve_lore(
+    query: str,
+    k: int = 4,
+    backend: VectorBackend = "chroma",
+    game: Optional[GameKey] = None,
+    entity_type: Optional[EntityType] = None,
+    section: Optional[str] = None,
+) -> List[Document]:
     """
     Retrieve top-k lore chunks for a given query from the specified backend.
+    Optional game/entity_type/section filters restrict the search to the
+    matching partitions before similarity ranking.
+
+    Small child chunks are matched, then expanded into their parent sections
+    (de-duplicated), so up to k distinct parent blocks are returned.
     Currently supports 'chroma'; TODO: add 'faiss', 'pinecone', etc.
     """
-    vs = get_vectorstore(backend=backend)
-    retriever = vs.as_retriever(search_kwargs={"k": k})
-    return retriever.invoke(query)
+    # Over-fetch children: several hits often land in the same parent
+    search_kwargs: dict = {"k": k * CHILD_OVERFETCH}
+    where = build_metadata_filter(game=game, entity_type=entity_type, section=section)
+    if where is not None:
+        search_kwargs["filter"] = where
+
+    # Stay on one index version for the whole query, even if a swap happens mid-way
+    with lease_index(backend) as index:
+        retriever = index.vectorstore.as_retriever(search_kwargs=search_kwargs)
+        children = retriever.invoke(query)
+        return expand_to_parents(children, k=k, store=index.parent_store)
+
+
+def expand_to_parents(children: List[Document], k: int, store: ParentStore) -> List[Document]:
+    """
+    Replace child hits with their parent blocks, keeping first-hit order and
+    dropping repeat parents. Children without a stored parent (e.g. an index
+    built before hierarchical chunking) are passed through unchanged.
+    """
+    parents = store.get_many(
+        d.metadata["parent_id"] for d in children if d.metadata.get("parent_id")
+    )
+
+    results: List[Document] = []
+    seen: set[str] = set()
+    for child in children:
+        pid = child.metadata.get("parent_id")
+        parent = parents.get(pid) if pid else None
+        key = pid if parent is not None else f"child:{id(child)}"
+        if key in seen:
+            continue
+        seen.add(key)
+
+        if parent is None:
+            results.append(child)
+        else:
+            # Keep the child's provenance (source_titles...), but not its chunk_index:
+            # the text is the parent block, which parent_index identifies.
+            # match_start/match_end locate the matched child so excerpts can centre on it.
+            metadata = dict(child.metadata)
+            metadata.pop("chunk_index", None)
+            start = parent.page_content.find(child.page_content)
+            if start >= 0:
+                metadata["match_start"] = start
+                metadata["match_end"] = start + len(child.page_content)
+            results.append(Document(page_content=parent.page_content, metadata=metadata))
+
+        if len(results) >= k:
+            break
+    return results
+
+
+def citation_index(doc: Document) -> int:
+    """
+    Index of the text a retrieved Document actually holds: its chunk_index for a
+    passed-through child, else the parent_index of the expanded parent block.
+    """
+    index = doc.metadata.get("chunk_index", doc.metadata.get("parent_index", -1))
+    return int(index)
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build/inspect the RODIN vectorstore")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Build a new index version and swap it live (a running API picks it up)",
+    )
+    args = parser.parse_args()
+
+    if args.rebuild:
+        # A running API may still be serving older versions; it garbage-collects them
+        rebuild_index("chroma", collect=False)
+
     vs_dir = get_vectorstore_dir("chroma")
     print(f"Chroma vectorstore directory: {vs_dir}")
+    print(f"Live version: {read_current_version('chroma')}")
 
     docs = retrieve_lore("What is Rapture?", k=3, backend="chroma")
 
     print("\nTop 3 retrieved chunks for query: 'What is Rapture?'")
     for i, d in enumerate(docs, start=1):
         title = d.metadata.get("page_title", "<no title>")
-        idx = d.metadata.get("chunk_index", "?")
+        idx = citation_index(d)
         preview = (d.page_content[:200] + "...") if len(d.page_content) > 200 else d.page_content
 
         print("--------------------------------------------------")
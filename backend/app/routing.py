@@ -0,0 +1,264 @@
+# backend/app/routing.py
+from __future__ import annotations
+
+import math
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional
+
+
+# --- Model catalogue ---
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    name: str
+    capability: int  # 0 = basic, higher = handles harder questions
+    usd_per_1m_input_tokens: float
+
+
+# Cheapest first. Prices are only used for ordering and reporting.
+MODEL_TIERS: tuple[ModelTier, ...] = (
+    ModelTier("gpt-4o-mini", capability=0, usd_per_1m_input_tokens=0.15),
+    ModelTier("gpt-4.1-mini", capability=1, usd_per_1m_input_tokens=0.40),
+    ModelTier("gpt-4o", capability=2, usd_per_1m_input_tokens=2.50),
+)
+
+
+# --- Per-user usage with exponential decay ---
+
+
+@dataclass
+class DecayingCounter:
+    """A counter that halves every `half_life_s` seconds without any resets."""
+
+    half_life_s: float
+    value: float = 0.0
+    updated_at: float = field(default_factory=time.monotonic)
+
+    def current(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        elapsed = max(0.0, now - self.updated_at)
+        return self.value * math.pow(0.5, elapsed / self.half_life_s)
+
+    def add(self, amount: float, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        self.value = self.current(now) + amount
+        self.updated_at = now
+        return self.value
+
+
+# --- Per-model health (latency / errors over a sliding window) ---
+
+
+@dataclass
+class _Sample:
+    at: float
+    latency_s: float
+    ok: bool
+
+
+@dataclass
+class ModelHealth:
+    window_s: float = 300.0
+    max_samples: int = 200
+    samples: Deque[_Sample] = field(default_factory=deque)
+
+    def record(self, latency_s: float, ok: bool, now: Optional[float] = None) -> None:
+        now = time.monotonic() if now is None else now
+        self.samples.append(_Sample(now, latency_s, ok))
+        while len(self.samples) > self.max_samples:
+            self.samples.popleft()
+
+    def _recent(self, now: float) -> List[_Sample]:
+        while self.samples and now - self.samples[0].at > self.window_s:
+            self.samples.popleft()
+        return list(self.samples)
+
+    def p95_latency(self, now: Optional[float] = None) -> Optional[float]:
+        now = time.monotonic() if now is None else now
+        latencies = sorted(s.latency_s for s in self._recent(now) if s.ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, math.ceil(0.95 * len(latencies)) - 1)]
+
+    def sample_count(self, now: Optional[float] = None) -> int:
+        now = time.monotonic() if now is None else now
+        return len(self._recent(now))
+
+    def error_rate(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        recent = self._recent(now)
+        if not recent:
+            return 0.0
+        return sum(not s.ok for s in recent) / len(recent)
+
+
+# --- Question complexity ---
+
+_HARD_MARKERS = re.compile(
+    r"\b(compare|comparison|differ|difference|versus|vs|why|explain|relationship|"
+    r"timeline|chronolog|motivation|theory|theories|connect|influence|all of)\b",
+    re.IGNORECASE,
+)
+_PROPER_NOUN = re.compile(r"\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b")
+# Capitalised only because they start the sentence, not named things
+_LEADING_WORDS = frozenset(
+    "what who whom whose where when why how which is are was were did does do "
+    "can could would should tell explain describe compare list give the a an in "
+    "on of and or but if".split()
+)
+
+
+def named_things(question: str) -> set[str]:
+    """Distinct capitalised names in the question, minus sentence-initial function words."""
+    names: set[str] = set()
+    for match in _PROPER_NOUN.findall(question):
+        words = match.split()
+        while words and words[0].lower() in _LEADING_WORDS:
+            words.pop(0)
+        if words:
+            names.add(" ".join(words))
+    return names
+
+
+def estimate_complexity(question: str, thread_messages: int = 0) -> float:
+    """
+    Cheap 0.0 - 1.0 complexity score from surface features of the question:
+    length, reasoning keywords, number of named things and multi-part asks.
+    A long thread nudges the score up a little (more context to juggle).
+    """
+    words = len(question.split())
+    score = min(words / 60.0, 0.35)
+    score += min(len(_HARD_MARKERS.findall(question)) * 0.2, 0.4)
+    score += min(max(len(named_things(question)) - 1, 0) * 0.08, 0.24)
+    score += min(max(question.count("?") - 1, 0) * 0.1, 0.2)
+    score += min(thread_messages / 100.0, 0.1)
+    return min(score, 1.0)
+
+
+def required_capability(complexity: float) -> int:
+    if complexity >= 0.75:
+        return 2
+    if complexity >= 0.4:
+        return 1
+    return 0
+
+
+# --- Router ---
+
+
+@dataclass
+class RouteDecision:
+    model: str
+    fallbacks: List[str]
+    complexity: float
+    capability: int
+    user_usage: float
+
+
+class ModelRouter:
+    """
+    Picks the cheapest model that is capable enough for a question and is
+    currently meeting the latency SLO, with the rest as ordered fallbacks.
+    A model is only judged on latency/errors once it has `min_samples` calls
+    in the health window.
+
+    Heavy users (decayed token usage over `user_token_budget`) are capped at
+    the basic tier until their usage decays back under budget.
+    """
+
+    def __init__(
+        self,
+        tiers: tuple[ModelTier, ...] = MODEL_TIERS,
+        latency_slo_s: float = 8.0,
+        max_error_rate: float = 0.2,
+        min_samples: int = 20,
+        user_token_budget: float = 50_000.0,
+        usage_half_life_s: float = 1800.0,
+    ):
+        self.tiers = tuple(sorted(tiers, key=lambda t: t.usd_per_1m_input_tokens))
+        self.latency_slo_s = latency_slo_s
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.user_token_budget = user_token_budget
+        self.usage_half_life_s = usage_half_life_s
+
+        self._lock = threading.Lock()
+        self._usage: Dict[str, DecayingCounter] = {}
+        self._health: Dict[str, ModelHealth] = {t.name: ModelHealth() for t in self.tiers}
+
+    # --- bookkeeping ---
+
+    def _counter(self, user_id: str) -> DecayingCounter:
+        counter = self._usage.get(user_id)
+        if counter is None:
+            counter = self._usage[user_id] = DecayingCounter(self.usage_half_life_s)
+        return counter
+
+    def user_usage(self, user_id: str) -> float:
+        with self._lock:
+            return self._counter(user_id).current()
+
+    def record_usage(self, user_id: str, tokens: float) -> None:
+        with self._lock:
+            self._counter(user_id).add(tokens)
+            # Drop users whose usage has decayed to nothing so the map stays small
+            now = time.monotonic()
+            stale = [u for u, c in self._usage.items() if c.current(now) < 1.0 and u != user_id]
+            for u in stale:
+                del self._usage[u]
+
+    def record_result(self, model: str, latency_s: float, ok: bool) -> None:
+        with self._lock:
+            self._health.setdefault(model, ModelHealth()).record(latency_s, ok)
+
+    def is_healthy(self, model: str) -> bool:
+        with self._lock:
+            health = self._health.get(model)
+            # Too few calls in the window to judge; one slow call isn't a trend
+            if health is None or health.sample_count() < self.min_samples:
+                return True
+            p95 = health.p95_latency()
+            if p95 is not None and p95 > self.latency_slo_s:
+                return False
+            return health.error_rate() <= self.max_error_rate
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Current per-model p95 latency and error rate (for logging / health)."""
+        with self._lock:
+            return {
+                name: {"p95_latency_s": h.p95_latency(), "error_rate": h.error_rate()}
+                for name, h in self._health.items()
+            }
+
+    # --- routing ---
+
+    def route(self, user_id: str, question: str, thread_messages: int = 0) -> RouteDecision:
+        complexity = estimate_complexity(question, thread_messages)
+        capability = required_capability(complexity)
+        usage = self.user_usage(user_id)
+        if usage > self.user_token_budget:
+            capability = 0
+
+        capable = [t for t in self.tiers if t.capability >= capability]
+        weaker = sorted(
+            (t for t in self.tiers if t.capability < capability),
+            key=lambda t: -t.capability,
+        )
+        preference = [t.name for t in capable + weaker]
+
+        healthy = [m for m in preference if self.is_healthy(m)]
+        unhealthy = [m for m in preference if m not in healthy]
+        ordered = healthy + unhealthy
+
+        return RouteDecision(
+            model=ordered[0],
+            fallbacks=ordered[1:],
+            complexity=complexity,
+            capability=capability,
+            user_usage=usage,
+        )
@@ -5,7 +5,7 @@ from typing import Optional
 from langchain.chat_models import init_chat_model
 from langchain_core.messages import SystemMessage, HumanMessage
 
-from .config import OPENAI_API_KEY
+from .config import OPENAI_API_KEY, OPENAI_BASE_URL
 
 
 _VERIFIER_SYSTEM = """You are a careful copy editor for a lore Q&A system.
@@ -37,6 +37,7 @@ def verify_and_polish_summary(
         model_name,
         model_provider="openai",
         api_key=OPENAI_API_KEY,
+        base_url=OPENAI_BASE_URL,
         temperature=0.0,
     )
 
@@ -0,0 +1,507 @@
+"""
+Load-test harness for the RODIN API against a local OpenAI-compatible stub.
+
+Starts a stub of /v1/chat/completions and /v1/embeddings with a configurable
+latency/token-rate profile, launches the FastAPI backend pointed at it
+(OPENAI_BASE_URL), and drives /ask at a target request rate from many
+simulated Discord users and threads. Reports throughput, latency
+percentiles, error rates and the API process's memory over time.
+
+    python scripts/loadtest.py --rps 5 --duration 120 --users 200
+    python scripts/loadtest.py --profile degraded --rps 2
+    python scripts/loadtest.py --stub-only --profile realistic   # just the stub
+
+The first run builds a scratch index (from the dump, with stub embeddings)
+under --vectorstore-root; later runs reuse it.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+import httpx
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # RODIN/
+
+
+# --- Stub latency profiles ---
+
+
+@dataclass(frozen=True)
+class LatencyProfile:
+    ttft_s: float  # time to first token
+    tokens_per_s: float  # generation speed after the first token
+    jitter: float  # +/- fraction applied to every delay
+    error_rate: float  # fraction of requests answered with a 500/429
+    embed_latency_s: float  # per embeddings request
+
+
+PROFILES: dict[str, LatencyProfile] = {
+    "instant": LatencyProfile(ttft_s=0.0, tokens_per_s=1e9, jitter=0.0, error_rate=0.0, embed_latency_s=0.0),
+    "fast": LatencyProfile(ttft_s=0.15, tokens_per_s=200, jitter=0.2, error_rate=0.0, embed_latency_s=0.05),
+    "realistic": LatencyProfile(ttft_s=0.5, tokens_per_s=60, jitter=0.3, error_rate=0.005, embed_latency_s=0.2),
+    "degraded": LatencyProfile(ttft_s=2.0, tokens_per_s=20, jitter=0.5, error_rate=0.05, embed_latency_s=0.8),
+}
+
+QUESTIONS = (
+    "What is Rapture?",
+    "Who is Andrew Ryan?",
+    "What are Big Daddies?",
+    "Tell me about Columbia.",
+    "Who is Booker DeWitt?",
+    "What is ADAM and how is it harvested?",
+    "Compare Andrew Ryan and Zachary Hale Comstock and explain why their ideologies differ.",
+    "What happened to Fontaine Futuristics?",
+    "Who is Elizabeth?",
+    "What is the timeline of the fall of Rapture?",
+)
+
+_SUMMARY_RE = re.compile(r"SUMMARY:\n(.*?)\n\nEVIDENCE", re.DOTALL)
+
+
+def _jittered(seconds: float, jitter: float) -> float:
+    if seconds <= 0:
+        return 0.0
+    return max(0.0, seconds * (1 + random.uniform(-jitter, jitter)))
+
+
+def _message_text(message: dict) -> str:
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content)
+
+
+def _fake_completion(body: dict) -> tuple[dict, int]:
+    """
+    Decide what the agent would see from a real model: call the lore tool on
+    a fresh user turn, answer through the structured-output tool once tool
+    results are in, and echo the summary for verifier calls (no tools).
+    Returns (assistant message, completion tokens).
+    """
+    messages = body.get("messages", [])
+    tool_names = [t.get("function", {}).get("name") for t in body.get("tools") or []]
+    last = messages[-1] if messages else {}
+
+    def tool_call(name: str, args: dict) -> dict:
+        return {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(args)},
+            }],
+        }
+
+    if not tool_names:
+        match = _SUMMARY_RE.search(_message_text(last))
+        text = match.group(1).strip() if match else "Stub answer."
+        return {"role": "assistant", "content": text}, max(1, len(text) // 4)
+
+    question = next(
+        (_message_text(m) for m in reversed(messages) if m.get("role") == "user"),
+        "",
+    )
+    if last.get("role") == "user" and "get_bioshock_lore" in tool_names:
+        return tool_call("get_bioshock_lore", {"query": question}), 20
+
+    structured = next((n for n in tool_names if n != "get_bioshock_lore"), None)
+    if structured is not None:
+        evidence = _message_text(last)[:200]
+        summary = f"Stub summary for {question!r}. Based on: {evidence}"
+        args = {
+            "summary": summary,
+            "key_entities": ["Rapture"],
+            "timeline_events": [],
+            "sources": [],
+            "confidence": "medium",
+            "notes": None,
+        }
+        return tool_call(structured, args), 150
+
+    return {"role": "assistant", "content": "Stub answer."}, 5
+
+
+def _fake_vector(key: str, dim: int) -> list[float]:
+    """Deterministic pseudo-embedding so identical text maps to identical vectors."""
+    rng = random.Random(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest())
+    vec = [rng.gauss(0.0, 1.0) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def build_stub_app(profile: LatencyProfile, embedding_dim: int) -> FastAPI:
+    stub = FastAPI(title="RODIN OpenAI stub")
+    stats: Counter = Counter()
+
+    def maybe_error() -> Optional[JSONResponse]:
+        if random.random() < profile.error_rate:
+            status = random.choice((429, 500))
+            stats[f"injected_{status}"] += 1
+            return JSONResponse(
+                status_code=status,
+                content={"error": {"message": "stub injected error", "type": "stub_error"}},
+            )
+        return None
+
+    @stub.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["chat"] += 1
+        if (err := maybe_error()) is not None:
+            return err
+
+        message, completion_tokens = _fake_completion(body)
+        prompt_tokens = sum(len(_message_text(m)) for m in body.get("messages", [])) // 4
+
+        delay = profile.ttft_s + completion_tokens / profile.tokens_per_s
+        await asyncio.sleep(_jittered(delay, profile.jitter))
+
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if message.get("tool_calls") else "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    @stub.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        stats["embeddings"] += 1
+        if (err := maybe_error()) is not None:
+            return err
+
+        inputs: Any = body.get("input", [])
+        # str | list[str] | list[int] (one tokenized input) | list[list[int]]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+
+        await asyncio.sleep(_jittered(profile.embed_latency_s, profile.jitter))
+
+        as_base64 = body.get("encoding_format") == "base64"
+        data = []
+        for i, item in enumerate(inputs):
+            vec = _fake_vector(json.dumps(item), embedding_dim)
+            if as_base64:
+                packed = struct.pack(f"<{embedding_dim}f", *vec)
+                embedding: Any = base64.b64encode(packed).decode("ascii")
+            else:
+                embedding = vec
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+
+        n_tokens = sum(len(x) if isinstance(x, list) else len(str(x)) // 4 for x in inputs)
+        return {
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "stub"),
+            "usage": {"prompt_tokens": n_tokens, "total_tokens": n_tokens},
+        }
+
+    @stub.get("/stats")
+    def stub_stats():
+        return dict(stats)
+
+    return stub
+
+
+def start_stub_server(app: FastAPI, port: int) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True, name="openai-stub").start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+# --- API process ---
+
+
+def start_api(port: int, stub_port: int, vectorstore_root: Path) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{stub_port}/v1",
+        "OPENAI_API_KEY": "sk-stub",
+        "RODIN_VECTORSTORE_ROOT": str(vectorstore_root),
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app.api:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=BASE_DIR,
+        env=env,
+    )
+
+
+def read_rss_mb(pid: Optional[int]) -> Optional[float]:
+    """Resident set size from /proc (Linux only); None elsewhere."""
+    if pid is None:
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+async def wait_for_health(client: httpx.AsyncClient, base_url: str, timeout_s: float = 120) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(f"{base_url}/health")).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"API at {base_url} did not become healthy within {timeout_s:.0f}s")
+
+
+# --- Load driver ---
+
+
+@dataclass
+class Window:
+    started: float
+    latencies: list[float] = field(default_factory=list)
+    errors: Counter = field(default_factory=Counter)
+    shed: int = 0
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def _slope_per_min(points: list[tuple[float, float]]) -> float:
+    """Least-squares slope (MB/min) of (seconds, MB) samples."""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_m = sum(m for _, m in points) / n
+    var = sum((t - mean_t) ** 2 for t, _ in points)
+    if var == 0:
+        return 0.0
+    return sum((t - mean_t) * (m - mean_m) for t, m in points) / var * 60
+
+
+async def run_load(args: argparse.Namespace, base_url: str, api_pid: Optional[int]) -> None:
+    users = [f"user-{i}" for i in range(args.users)]
+    threads = {u: [f"{u}-thread-{j}" for j in range(args.threads_per_user)] for u in users}
+
+    all_latencies: list[float] = []
+    all_errors: Counter = Counter()
+    total_shed = 0
+    rss_points: list[tuple[float, float]] = []
+
+    limits = httpx.Limits(max_connections=args.max_inflight, max_keepalive_connections=args.max_inflight)
+    async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as client:
+        await wait_for_health(client, base_url)
+
+        if not args.skip_warmup:
+            print("Warm-up request (builds/loads the index on first run)...")
+            resp = await client.post(
+                f"{base_url}/ask",
+                json={"user_id": "warmup", "message": QUESTIONS[0]},
+                timeout=None,
+            )
+            # A failing warm-up means every request will fail the same way; say why
+            if resp.status_code != 200:
+                raise SystemExit(
+                    f"Warm-up request failed with HTTP {resp.status_code}, aborting:\n{resp.text[:2000]}"
+                )
+
+        inflight: set[asyncio.Task] = set()
+        window = Window(started=time.monotonic())
+        run_started = window.started
+
+        async def one_request() -> None:
+            user = random.choice(users)
+            payload = {
+                "user_id": user,
+                "thread_id": random.choice(threads[user]),
+                "message": random.choice(QUESTIONS),
+            }
+            started = time.perf_counter()
+            try:
+                resp = await client.post(f"{base_url}/ask", json=payload)
+                if resp.status_code != 200:
+                    window.errors[f"http_{resp.status_code}"] += 1
+                    return
+            except httpx.HTTPError as e:
+                window.errors[type(e).__name__] += 1
+                return
+            window.latencies.append(time.perf_counter() - started)
+
+        def report(now: float) -> None:
+            nonlocal window, total_shed
+            elapsed = now - window.started
+            rss = read_rss_mb(api_pid)
+            if rss is not None:
+                rss_points.append((now - run_started, rss))
+            done = len(window.latencies)
+            errors = sum(window.errors.values())
+            print(
+                f"[t={now - run_started:6.0f}s] ok {done / elapsed:6.2f}/s | "
+                f"p50 {percentile(window.latencies, 0.5):6.2f}s "
+                f"p95 {percentile(window.latencies, 0.95):6.2f}s "
+                f"p99 {percentile(window.latencies, 0.99):6.2f}s | "
+                f"errors {errors} shed {window.shed} inflight {len(inflight)} | "
+                f"rss {f'{rss:.0f} MB' if rss is not None else 'n/a'}"
+            )
+            all_latencies.extend(window.latencies)
+            all_errors.update(window.errors)
+            total_shed += window.shed
+            window = Window(started=now)
+
+        # Open-loop Poisson arrivals: the offered rate doesn't drop when the API slows
+        deadline = run_started + args.duration
+        next_report = run_started + args.report_every
+        next_arrival = run_started
+        while True:
+            now = time.monotonic()
+            # The last interval is reported after the drain, so it includes drained requests
+            if now >= deadline:
+                break
+            if now >= next_report:
+                report(now)
+                next_report += args.report_every
+            if now >= next_arrival:
+                if len(inflight) >= args.max_inflight:
+                    window.shed += 1
+                else:
+                    task = asyncio.create_task(one_request())
+                    inflight.add(task)
+                    task.add_done_callback(inflight.discard)
+                next_arrival += random.expovariate(args.rps)
+                continue
+            await asyncio.sleep(min(next_arrival, next_report, deadline) - now)
+
+        if inflight:
+            print(f"Draining {len(inflight)} in-flight requests...")
+            await asyncio.gather(*inflight, return_exceptions=True)
+        report(time.monotonic())
+        total_s = time.monotonic() - run_started
+
+    completed = len(all_latencies)
+    attempted = completed + sum(all_errors.values())
+    print("\n=== Summary ===")
+    print(f"offered rate:   {args.rps:g} req/s for {args.duration:g}s "
+          f"({args.users} users x {args.threads_per_user} threads)")
+    print(f"throughput:     {completed / total_s:.2f} req/s ({completed} ok)")
+    print(f"latency:        p50 {percentile(all_latencies, 0.5):.2f}s | "
+          f"p95 {percentile(all_latencies, 0.95):.2f}s | p99 {percentile(all_latencies, 0.99):.2f}s | "
+          f"max {max(all_latencies, default=float('nan')):.2f}s")
+    error_rate = (sum(all_errors.values()) / attempted) if attempted else 0.0
+    print(f"errors:         {error_rate:.2%} {dict(all_errors) or ''}")
+    print(f"shed (client):  {total_shed} (dropped at max in-flight {args.max_inflight})")
+    if rss_points:
+        print(f"api rss:        {rss_points[0][1]:.0f} MB -> {rss_points[-1][1]:.0f} MB "
+              f"({_slope_per_min(rss_points):+.1f} MB/min)")
+    else:
+        print("api rss:        n/a (needs /proc and a known API pid)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the RODIN API against a local OpenAI stub")
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic", help="Stub latency profile")
+    parser.add_argument("--ttft", type=float, help="Override profile time-to-first-token (s)")
+    parser.add_argument("--tokens-per-s", type=float, help="Override profile generation speed")
+    parser.add_argument("--error-rate", type=float, help="Override profile injected error rate")
+    parser.add_argument("--embedding-dim", type=int, default=256, help="Stub embedding dimension")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--stub-only", action="store_true", help="Only run the stub server")
+
+    parser.add_argument("--api-url", help="Target an already running API instead of launching one")
+    parser.add_argument("--api-pid", type=int, help="PID of --api-url's process, for memory sampling")
+    parser.add_argument("--api-port", type=int, default=8901)
+    parser.add_argument("--vectorstore-root", type=Path, default=BASE_DIR / "backend" / "vectorstore-loadtest",
+                        help="Scratch vectorstore root for the launched API")
+
+    parser.add_argument("--rps", type=float, default=2.0, help="Target request rate (req/s)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Test duration (s)")
+    parser.add_argument("--users", type=int, default=50, help="Simulated Discord users")
+    parser.add_argument("--threads-per-user", type=int, default=2, help="Conversation threads per user")
+    parser.add_argument("--max-inflight", type=int, default=256, help="Client-side concurrency cap")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between interval reports")
+    parser.add_argument("--skip-warmup", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    base = PROFILES[args.profile]
+    profile = LatencyProfile(
+        ttft_s=base.ttft_s if args.ttft is None else args.ttft,
+        tokens_per_s=base.tokens_per_s if args.tokens_per_s is None else args.tokens_per_s,
+        jitter=base.jitter,
+        error_rate=base.error_rate if args.error_rate is None else args.error_rate,
+        embed_latency_s=base.embed_latency_s,
+    )
+
+    start_stub_server(build_stub_app(profile, args.embedding_dim), args.stub_port)
+    print(f"OpenAI stub on http://127.0.0.1:{args.stub_port}/v1 ({args.profile}: {profile})")
+
+    if args.stub_only:
+        print("Stub only; Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+
+    api_proc: Optional[subprocess.Popen] = None
+    if args.api_url:
+        base_url, api_pid = args.api_url.rstrip("/"), args.api_pid
+    else:
+        args.vectorstore_root.mkdir(parents=True, exist_ok=True)
+        api_proc = start_api(args.api_port, args.stub_port, args.vectorstore_root)
+        base_url, api_pid = f"http://127.0.0.1:{args.api_port}", api_proc.pid
+        print(f"API (pid {api_pid}) on {base_url}, vectorstore root {args.vectorstore_root}")
+
+    try:
+        asyncio.run(run_load(args, base_url, api_pid))
+    finally:
+        if api_proc is not None:
+            api_proc.terminate()
+            try:
+                api_proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                api_proc.kill()
+
+
+if __name__ == "__main__":
+    main()
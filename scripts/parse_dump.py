@@ -1,85 +1,314 @@
+"""
+Streaming analyzer for the MediaWiki dump.
+
+Reports page counts by namespace/kind, redirects, the text-length
+distribution, projected chunk and token totals for the current splitter
+settings, and the estimated embedding time/cost of a full index build.
+
+    python scripts/parse_dump.py
+    python scripts/parse_dump.py --workers 8 --exact-tokens
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from itertools import islice
 from pathlib import Path
-import xml.etree.ElementTree as ET
-
-DUMP_PATH = Path("../backend/data/raw/bioshock_pages_current.xml").resolve()
-
-# Remove all non-articles from the corpus
-BLOCKED_PREFIXES = (
-    "User:",
-    "User talk:",
-    "Talk:",
-    "Forum:",
-    "Message Wall:",
-    "Blog:",
+from typing import Iterable, Iterator
+
+BASE_DIR = Path(__file__).resolve().parents[1]  # RODIN/
+sys.path.insert(0, str(BASE_DIR))
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter  # noqa: E402
+
+from backend.app.ingestion import (  # noqa: E402
+    DUMP_PATH,
+    RawPage,
+    build_text_splitter,
+    chunk_page_text,
+    is_redirect,
+    iter_dump_pages,
 )
 
+# OpenAIEmbeddings defaults (langchain_openai): text-embedding-ada-002, 1000 inputs per request
+DEFAULT_EMBED_PRICE_PER_1M = 0.10
+DEFAULT_EMBED_TPM = 1_000_000
+DEFAULT_EMBED_BATCH = 1000
+
+# Flat whole-page chunking used before section-aware small-to-big chunking,
+# projected alongside for comparison
+FLAT_CHUNK_SIZE = 1000
+FLAT_CHUNK_OVERLAP = 200
+DEFAULT_REQUEST_LATENCY_S = 1.5
+
+CHARS_PER_TOKEN = 4.0
+
+# Length histogram buckets: [0], [1, 2), [2, 4), ... [2**30, inf)
+N_LENGTH_BUCKETS = 32
+
+
+def _length_bucket(n: int) -> int:
+    return 0 if n <= 0 else min(n.bit_length(), N_LENGTH_BUCKETS - 1)
+
+
+@dataclass
+class DumpStats:
+    """Mergeable counters; workers return one per batch, the parent sums them."""
+
+    pages: int = 0
+    by_ns: Counter = field(default_factory=Counter)
+    by_kind: Counter = field(default_factory=Counter)
+    redirects: Counter = field(default_factory=Counter)  # by kind
+    length_hist: list[int] = field(default_factory=lambda: [0] * N_LENGTH_BUCKETS)
+    total_chars: int = 0
+    max_chars: int = 0
+
+    # Projection for indexed pages (non-redirect articles)
+    indexed_pages: int = 0
+    chunks: int = 0
+    chunk_chars: int = 0
+    tokens: int = 0
+    flat_chunks: int = 0
+
+    def merge(self, other: DumpStats) -> None:
+        self.pages += other.pages
+        self.by_ns.update(other.by_ns)
+        self.by_kind.update(other.by_kind)
+        self.redirects.update(other.redirects)
+        self.length_hist = [a + b for a, b in zip(self.length_hist, other.length_hist)]
+        self.total_chars += other.total_chars
+        self.max_chars = max(self.max_chars, other.max_chars)
+        self.indexed_pages += other.indexed_pages
+        self.chunks += other.chunks
+        self.chunk_chars += other.chunk_chars
+        self.tokens += other.tokens
+        self.flat_chunks += other.flat_chunks
+
+    def length_percentile(self, q: float) -> int:
+        """Upper bound of the histogram bucket holding the q-th percentile."""
+        target = q * self.pages
+        seen = 0
+        for i, count in enumerate(self.length_hist):
+            seen += count
+            if count and seen >= target:
+                return 0 if i == 0 else 2**i - 1
+        return self.max_chars
+
+
+# --- Worker side ---
+
+_splitter = None
+_flat_splitter = None
+_encoder = None
+
+
+def _init_worker(exact_tokens: bool) -> None:
+    global _splitter, _flat_splitter, _encoder
+    _splitter = build_text_splitter()
+    _flat_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=FLAT_CHUNK_SIZE,
+        chunk_overlap=FLAT_CHUNK_OVERLAP,
+        separators=["\n\n", "\n", ". ", " "],
+    )
+    if exact_tokens:
+        import tiktoken
+
+        # ada-002 and the text-embedding-3 models all use cl100k_base
+        _encoder = tiktoken.get_encoding("cl100k_base")
+
+
+def _count_tokens(text: str) -> int:
+    if _encoder is not None:
+        return len(_encoder.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def analyze_batch(batch: list[tuple[str, int, str, str]]) -> DumpStats:
+    stats = DumpStats()
+    for _title, ns, text, kind in batch:
+        n = len(text)
+        stats.pages += 1
+        stats.by_ns[ns] += 1
+        stats.by_kind[kind] += 1
+        stats.length_hist[_length_bucket(n)] += 1
+        stats.total_chars += n
+        stats.max_chars = max(stats.max_chars, n)
 
-def classify_page(ns: int, title: str) -> str:
+        if is_redirect(text):
+            stats.redirects[kind] += 1
+            continue
+        if kind != "article":
+            continue
+
+        stats.indexed_pages += 1
+        for _section, chunk in chunk_page_text(text, _splitter):
+            stats.chunks += 1
+            stats.chunk_chars += len(chunk)
+            stats.tokens += _count_tokens(chunk)
+        stats.flat_chunks += len(_flat_splitter.split_text(text))
+    return stats
+
+
+# --- Parent side ---
+
+
+def _batches(pages: Iterable[RawPage], size: int) -> Iterator[list[tuple[str, int, str, str]]]:
+    it = iter(pages)
+    while True:
+        batch = [(p.title, p.ns, p.text, p.kind) for p in islice(it, size)]
+        if not batch:
+            return
+        yield batch
+
+
+class _SampleCollector:
+    def __init__(self, n: int):
+        self.n = n
+        self.samples: dict[str, list[RawPage]] = {"article": [], "forum": []}
+
+    def __call__(self, pages: Iterable[RawPage]) -> Iterator[RawPage]:
+        for page in pages:
+            bucket = self.samples[page.kind]
+            if len(bucket) < self.n:
+                bucket.append(page)
+            yield page
+
+
+def analyze_dump(
+    dump_path: Path,
+    workers: int,
+    batch_size: int,
+    exact_tokens: bool,
+    samples: _SampleCollector,
+) -> DumpStats:
     """
-    Return 'article' for main canon pages,
-    'forum' for talk/user/forum/etc.
+    Parse in the parent (iterparse is sequential) and fan batches out to
+    worker processes. At most 2 batches per worker are in flight, so memory
+    stays flat no matter how far the parser runs ahead.
     """
-    if ns != 0:
-        return "forum"
-    if title.startswith(BLOCKED_PREFIXES):
-        return "forum"
-    return "article"
+    total = DumpStats()
+    batches = _batches(samples(iter_dump_pages(dump_path)), batch_size)
+
+    if workers <= 1:
+        _init_worker(exact_tokens)
+        for batch in batches:
+            total.merge(analyze_batch(batch))
+        return total
+
+    max_in_flight = workers * 2
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(exact_tokens,),
+    ) as pool:
+        in_flight: set[Future] = set()
+        for batch in batches:
+            in_flight.add(pool.submit(analyze_batch, batch))
+            if len(in_flight) >= max_in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for f in done:
+                    total.merge(f.result())
+        for f in in_flight:
+            total.merge(f.result())
+    return total
+
+
+def _fmt_duration(seconds: float) -> str:
+    if seconds < 90:
+        return f"{seconds:.0f}s"
+    if seconds < 5400:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def print_report(stats: DumpStats, samples: _SampleCollector, args: argparse.Namespace, elapsed: float) -> None:
+    print(f"\nAnalyzed {stats.pages} <page> elements in {elapsed:.1f}s")
+
+    print("\nPages by kind:")
+    for kind, count in stats.by_kind.most_common():
+        print(f"  {kind:<10} {count:>8}   (redirects: {stats.redirects.get(kind, 0)})")
+
+    print("\nPages by namespace:")
+    for ns, count in sorted(stats.by_ns.items()):
+        print(f"  ns={ns:<6} {count:>8}")
+
+    mean = stats.total_chars / stats.pages if stats.pages else 0
+    print("\nText length (chars):")
+    print(f"  mean {mean:,.0f} | max {stats.max_chars:,}")
+    for q in (0.5, 0.9, 0.99):
+        print(f"  p{int(q * 100):<3} <= {stats.length_percentile(q):,}")
+    print("  histogram:")
+    for i, count in enumerate(stats.length_hist):
+        if count:
+            lo = 0 if i == 0 else 2 ** (i - 1)
+            hi = 0 if i == 0 else 2**i - 1
+            print(f"    {lo:>9,} - {hi:>9,}  {count:>8}")
+
+    token_kind = "tiktoken cl100k_base" if args.exact_tokens else f"~{CHARS_PER_TOKEN:g} chars/token"
+    print("\nIndex projection (non-redirect articles, before near-duplicate removal):")
+    print(f"  pages indexed: {stats.indexed_pages:,}")
+    print(f"  chunks:        {stats.chunks:,}")
+    if stats.flat_chunks:
+        print(f"                 {stats.chunks / stats.flat_chunks:.2f}x the {stats.flat_chunks:,} of flat "
+              f"{FLAT_CHUNK_SIZE}/{FLAT_CHUNK_OVERLAP} chunking")
+    print(f"  chunk chars:   {stats.chunk_chars:,}")
+    print(f"  tokens:        {stats.tokens:,} ({token_kind})")
+
+    requests = math.ceil(stats.chunks / args.embed_batch) if stats.chunks else 0
+    rate_limited_s = stats.tokens / args.embed_tpm * 60
+    latency_bound_s = requests * args.request_latency
+    cost = stats.tokens / 1_000_000 * args.embed_price
+
+    print("\nEmbedding estimate:")
+    print(f"  requests:      {requests:,} (batch of {args.embed_batch})")
+    print(f"  time:          ~{_fmt_duration(max(rate_limited_s, latency_bound_s))} "
+          f"(TPM limit {args.embed_tpm:,}, {args.request_latency:g}s per request)")
+    print(f"  cost:          ~${cost:,.2f} (${args.embed_price:g} per 1M tokens)")
+
+    for kind, label in (("article", "article"), ("forum", "forum/discussion")):
+        print(f"\nSample {label} pages:")
+        for page in samples.samples[kind]:
+            preview = (page.text[:120] + "...") if len(page.text) > 120 else page.text
+            print("--------------------------------------------------")
+            print(f"Title: {page.title} (ns={page.ns})")
+            print(f"Preview: {preview!r}")
 
 
 def main():
-    # confirm that DUMP_PATH leads to raw data files
-    if not DUMP_PATH.exists():
-        raise FileNotFoundError(f"Dump not found at: {DUMP_PATH.absolute()}")
-
-    # load .xml database dump and parse
-    print(f"Loading dump: {DUMP_PATH}")
-    tree = ET.parse(DUMP_PATH)
-    root = tree.getroot()
-
-    pages = root.findall(".//{*}page")
-    print(f"Total <page> elements found: {len(pages)}")
-
-    article_pages = []
-    forum_pages = []
-
-    for page in pages:
-        title_el = page.find("./{*}title")
-        ns_el = page.find("./{*}ns")
-        text_el = page.find(".//{*}text")
-
-        title = title_el.text if title_el is not None else "<NO TITLE>"
-        ns = int(ns_el.text) if ns_el is not None and ns_el.text.isdigit() else -1
-        text = text_el.text if text_el is not None else ""
-
-        kind = classify_page(ns, title)
-
-        record = {
-            "title": title,
-            "ns": ns,
-            "text": text,
-        }
-
-        if kind == "article":
-            article_pages.append(record)
-        else:
-            forum_pages.append(record)
-
-    print(f"\nArticle-like pages (canon-ish): {len(article_pages)}")
-    print(f"Forum/discussion-like pages:   {len(forum_pages)}")
-
-    print("\nSample article pages:")
-    for rec in article_pages[:5]:
-        preview = (rec["text"][:120] + "...") if len(rec["text"]) > 120 else rec["text"]
-        print("--------------------------------------------------")
-        print(f"Title: {rec['title']} (ns={rec['ns']})")
-        print(f"Preview: {preview!r}")
-
-    print("\nSample forum/discussion pages:")
-    for rec in forum_pages[:5]:
-        preview = (rec["text"][:120] + "...") if len(rec["text"]) > 120 else rec["text"]
-        print("--------------------------------------------------")
-        print(f"Title: {rec['title']} (ns={rec['ns']})")
-        print(f"Preview: {preview!r}")
+    parser = argparse.ArgumentParser(description="Analyze the MediaWiki dump and estimate index build cost")
+    parser.add_argument("--dump", type=Path, default=DUMP_PATH, help="Path to the XML dump")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for chunking/token counting (1 = in-process)")
+    parser.add_argument("--batch-size", type=int, default=200, help="Pages per worker task")
+    parser.add_argument("--samples", type=int, default=5, help="Sample pages to print per kind")
+    parser.add_argument("--exact-tokens", action="store_true",
+                        help="Count tokens with tiktoken instead of a chars/4 estimate (slower)")
+    parser.add_argument("--embed-price", type=float, default=DEFAULT_EMBED_PRICE_PER_1M,
+                        help="Embedding price in USD per 1M tokens")
+    parser.add_argument("--embed-tpm", type=int, default=DEFAULT_EMBED_TPM,
+                        help="Embedding tokens-per-minute rate limit")
+    parser.add_argument("--embed-batch", type=int, default=DEFAULT_EMBED_BATCH,
+                        help="Chunks per embedding request")
+    parser.add_argument("--request-latency", type=float, default=DEFAULT_REQUEST_LATENCY_S,
+                        help="Assumed seconds per embedding request (sequential)")
+    args = parser.parse_args()
+
+    # confirm that the dump path leads to raw data files
+    if not args.dump.exists():
+        raise FileNotFoundError(f"Dump not found at: {args.dump.absolute()}")
+
+    print(f"Streaming dump: {args.dump} ({args.dump.stat().st_size / 1e6:,.1f} MB, {args.workers} workers)")
+
+    samples = _SampleCollector(args.samples)
+    started = time.perf_counter()
+    stats = analyze_dump(args.dump, args.workers, args.batch_size, args.exact_tokens, samples)
+    print_report(stats, samples, args, time.perf_counter() - started)
 
 
 if __name__ == "__main__":